@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import aiohttp
+from azure.storage.queue.aio import QueueClient
+
+# main provides the logging and SIGINT/SIGTERM setup, and the pipeline stages
+from main import (
+    logger,
+    shutdown_event,
+    setup_logging,
+    install_signal_handlers,
+    AdaptivePoller,
+    MessageMetrics,
+    MAX_MESSAGES_PER_RECEIVE,
+    message_envelope,
+    start_message,
+    save_payload,
+    save_pdf_artifact,
+    load_embedded_pdf,
+    download_blob_pdf,
+    ocr_and_demarcate,
+    log_message_completed,
+    log_message_crashed,
+)
+from config import settings
+from ocr_processor import shutdown_page_pools
+from data_models import MessageEnvelope
+from blob_service import blob_reference
+
+
+async def download_pdf_async(context: dict, envelope: MessageEnvelope, http_session: aiohttp.ClientSession) -> Optional[bytearray]:
+    """Async stage 2b: streams the PDF at FilePath into memory; returns the PDF bytes or None."""
+    pdf_url = envelope.fields["FilePath"]
+    logger.info("✅ SUCCESS: PDF URL found in message (FilePath)")
+    logger.info(f"🔗 PDF URL: {pdf_url}")
+    try:
+        logger.info("🌐 PROCESSING: Starting PDF download from URL")
+        download_start_time = time.time()
+        async with http_session.get(pdf_url) as response:
+            logger.info(f"📊 HTTP Response: {response.status} {response.reason}")
+            response.raise_for_status()
+            save_payload(context, envelope)
+            pdf_data = bytearray()
+            async for chunk in response.content.iter_chunked(256 * 1024):
+                pdf_data += chunk
+        total_download_duration = time.time() - download_start_time
+        logger.info(f"✅ SUCCESS: PDF downloaded in {total_download_duration:.2f} seconds")
+        logger.info(f"📊 Total size: {len(pdf_data):,} bytes")
+        save_pdf_artifact(context, pdf_data, "url")
+        return pdf_data
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"❌ FAILURE: PDF download failed: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Unexpected error during PDF download: {e}")
+        return None
+
+
+async def process_message_async(envelope: MessageEnvelope, output_client: QueueClient, http_session: aiohttp.ClientSession, ocr_executor: ThreadPoolExecutor) -> bool:
+    """Async counterpart of main.process_message: I/O stays on the event loop, OCR and demarcation run on ocr_executor."""
+    loop = asyncio.get_running_loop()
+    message_content = envelope.fields
+    process_start_time = time.time()
+    try:
+        context = start_message(message_content)
+        if context is None:
+            return False
+
+        # 📄 PDF CONTENT PROCESSING
+        logger.info("📄 PROCESSING: Checking for PDF content in message")
+        if envelope.has_embedded_pdf:
+            pdf_data = await loop.run_in_executor(None, load_embedded_pdf, context, envelope)
+        elif blob_reference(message_content):
+            # The blob SDK's parallel block download runs on its own threads
+            pdf_data = await loop.run_in_executor(None, download_blob_pdf, context, envelope)
+        elif message_content.get("FilePath"):
+            pdf_data = await download_pdf_async(context, envelope, http_session)
+        else:
+            logger.warning(f"⚠️ WARNING: No PDF content or URL found for file: {context['client_filename']}. Cannot proceed.")
+            return False
+        if not pdf_data:
+            return False
+
+        classification_message = await loop.run_in_executor(ocr_executor, ocr_and_demarcate, context, pdf_data, message_content)
+        if classification_message is None:
+            return False
+
+        try:
+            logger.info(f"📡 PROCESSING: Sending SubDocumentDetails to classification queue: {settings.CLASSIFICATION_QUEUE_NAME}")
+            logger.info(f"📤 OUTPUT QUEUE MESSAGE: {json.dumps(classification_message, ensure_ascii=False)[:1000]}")
+            await output_client.send_message(json.dumps(classification_message))
+            logger.info(f"✅ SUCCESS: SubDocumentDetails message queued to {settings.CLASSIFICATION_QUEUE_NAME}")
+        except Exception as e:
+            logger.error(f"❌ FAILURE: Queue message processing failed: {e}", exc_info=True)
+            return False
+
+        log_message_completed(context)
+        return True
+
+    except Exception as e:
+        log_message_crashed(message_content, process_start_time, e)
+        return False
+
+
+async def keep_alive_async(input_client: QueueClient, message, lease: dict, stop_event: asyncio.Event) -> None:
+    """
+    Async lease heartbeat: extends the message's visibility until stop_event is set and keeps
+    the latest pop receipt in lease["pop_receipt"]. Stopped via the event rather than cancelled,
+    so an update that already reached the service is never lost.
+    """
+    interval = max(1, min(settings.LEASE_RENEWAL_INTERVAL, settings.QUEUE_VISIBILITY_TIMEOUT // 2))
+    while True:
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            updated = await input_client.update_message(message.id, pop_receipt=lease["pop_receipt"], visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT)
+            lease["pop_receipt"] = updated.pop_receipt
+            lease["extensions"] += 1
+            logger.info(f"⏳ LEASE: Extended message {message.id} by {settings.QUEUE_VISIBILITY_TIMEOUT}s (extension #{lease['extensions']})")
+        except Exception as e:
+            if getattr(e, 'status_code', None) in (400, 404):
+                lease["lost"] = True
+                logger.error(f"❌ LEASE LOST: Message {message.id} may be processed again by another replica: {e}")
+                return
+            logger.warning(f"⚠️ WARNING: Lease renewal failed for message {message.id}, retrying: {e}")
+
+
+async def handle_queue_message_async(message, input_client: QueueClient, output_client: QueueClient, http_session: aiohttp.ClientSession, ocr_executor: ThreadPoolExecutor, metrics: MessageMetrics) -> None:
+    """Processes one leased message under a lease heartbeat; deletes it only on success."""
+    start_time = time.time()
+    success = False
+    logger.info(f"🔄 PROCESSING: Message ID: {message.id}")
+    lease = {"pop_receipt": message.pop_receipt, "extensions": 0, "lost": False}
+    stop_event = asyncio.Event()
+    heartbeat = asyncio.create_task(keep_alive_async(input_client, message, lease, stop_event))
+
+    try:
+        try:
+            envelope = message_envelope(message)
+            success = await process_message_async(envelope, output_client, http_session, ocr_executor)
+        finally:
+            stop_event.set()
+            await heartbeat
+        logger.info(f"📊 DECODE: {envelope.decode_stats()}")
+
+        if success:
+            if lease["lost"]:
+                logger.warning(f"⚠️ WARNING: Lease on message {message.id} was lost during processing; another replica may have picked it up.")
+            logger.info(f"🗑️ PROCESSING: Deleting successfully processed message: {message.id}")
+            await input_client.delete_message(message.id, lease["pop_receipt"])
+            logger.info(f"✅ SUCCESS: Message {message.id} processed and deleted from input queue.")
+        else:
+            logger.error(f"❌ FAILURE: Failed to process message {message.id}. It will be reprocessed later.")
+
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ FAILURE: Invalid JSON in message {message.id}: {e}. Deleting message.")
+        await input_client.delete_message(message.id, lease["pop_receipt"])
+
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Unhandled error processing message {message.id}: {e}", exc_info=True)
+
+    metrics.record(success, time.time() - start_time)
+    logger.info(f"📊 MESSAGES: {metrics.summary()}")
+
+
+async def receive_messages_async(input_client: QueueClient, max_messages: int) -> list:
+    """Leases one page of up to max_messages, saves each raw message to artifacts and decodes it once (message.envelope)."""
+    pager = input_client.receive_messages(messages_per_page=max_messages, visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT)
+    messages = []
+    async for page in pager.by_page():
+        messages = [message async for message in page]
+        break  # First page only, as in AzureQueueService.receive_messages
+
+    for i, message in enumerate(messages):
+        try:
+            timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+            raw_path = os.path.join(settings.ARTIFACTS_DIR, f"received_{settings.INPUT_QUEUE_NAME}_{timestamp}_{i}.txt")
+            with open(raw_path, 'w', encoding='utf-8') as f:
+                f.write(message.content)
+        except Exception as e:
+            logger.error(f"❌ FAILURE: Failed to save received message {message.id} to artifacts: {e}")
+        try:
+            message.envelope = MessageEnvelope.decode(message.content)
+        except Exception as e:
+            logger.debug(f"ℹ️ INFO: Message {message.id} is not JSON; it will be rejected when handled: {e}")
+    return messages
+
+
+async def run() -> None:
+    """Asyncio queue loop: many downloads and queue calls in flight, OCR bounded by MAX_CONCURRENT_MESSAGES."""
+    logger.info("🚀 STARTING OCR PROCESSOR APPLICATION (asyncio pipeline)")
+    logger.info(f"📋 Python version: {sys.version}")
+    if not settings.AZURE_STORAGE_CONNECTION_STRING or not settings.INPUT_QUEUE_NAME or not settings.CLASSIFICATION_QUEUE_NAME:
+        logger.error("❌ CRITICAL FAILURE: Missing Azure Storage or Queue Name configuration.")
+        return
+    os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
+
+    ocr_slots = max(1, settings.MAX_CONCURRENT_MESSAGES)
+    max_in_flight = max(ocr_slots, settings.ASYNC_MAX_IN_FLIGHT_MESSAGES)
+    logger.info(f"📋 OCR slots: {ocr_slots}, messages in flight: {max_in_flight}")
+    metrics = MessageMetrics()
+    poller = AdaptivePoller(settings.POLL_MIN_INTERVAL, settings.POLL_MAX_INTERVAL, settings.POLL_BACKOFF_MULTIPLIER, settings.POLL_JITTER)
+    ocr_executor = ThreadPoolExecutor(max_workers=ocr_slots, thread_name_prefix="ocr")
+    http_timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+    tasks = set()
+
+    try:
+        async with QueueClient.from_connection_string(settings.AZURE_STORAGE_CONNECTION_STRING, settings.INPUT_QUEUE_NAME) as input_client, \
+                QueueClient.from_connection_string(settings.AZURE_STORAGE_CONNECTION_STRING, settings.CLASSIFICATION_QUEUE_NAME) as output_client, \
+                aiohttp.ClientSession(timeout=http_timeout, headers={'User-Agent': 'iPerform-OCR-Processor/1.0'},
+                                      connector=aiohttp.TCPConnector(limit=max_in_flight)) as http_session:
+            logger.info("✅ SUCCESS: Async queue clients and HTTP session ready. Starting main loop.")
+            while not shutdown_event.is_set():
+                try:
+                    tasks = {task for task in tasks if not task.done()}
+                    free_slots = max_in_flight - len(tasks)
+                    wait_seconds = poller.seconds_until_poll() if free_slots > 0 else 1
+                    if wait_seconds > 0:
+                        if tasks:
+                            await asyncio.wait(tasks, timeout=min(wait_seconds, 1), return_when=asyncio.FIRST_COMPLETED)
+                        else:
+                            await asyncio.sleep(min(wait_seconds, 1))
+                        continue
+
+                    messages = await receive_messages_async(input_client, min(free_slots, MAX_MESSAGES_PER_RECEIVE))
+                    delay = poller.record(len(messages))
+                    if messages:
+                        logger.info(f"✅ SUCCESS: Retrieved {len(messages)} messages.")
+                        for message in messages:
+                            tasks.add(asyncio.create_task(handle_queue_message_async(message, input_client, output_client, http_session, ocr_executor, metrics)))
+                    else:
+                        logger.info(f"ℹ️ INFO: No messages in queue. Next poll in {delay:.1f} seconds ({poller.summary()}).")
+
+                except Exception as e:
+                    logger.error(f"💥 CRITICAL FAILURE: Error in main loop: {e}", exc_info=True)
+                    logger.info("😴 WAITING: 30 seconds before retrying.")
+                    for _ in range(30):
+                        if shutdown_event.is_set():
+                            break
+                        await asyncio.sleep(1)
+
+            if tasks:
+                logger.info(f"🛑 SHUTDOWN: Waiting for {len(tasks)} in-flight messages to finish")
+                await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        ocr_executor.shutdown(wait=True)
+
+    logger.info(f"📊 FINAL: {metrics.summary()}")
+    logger.info(f"📊 FINAL: {poller.summary()}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    install_signal_handlers()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("🔔 KeyboardInterrupt received - shutting down")
+    finally:
+        shutdown_page_pools()
+        logger.info("🛑 OCR processor exiting")
@@ -1,25 +1,75 @@
 import logging
+import threading
 import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
 from azure.storage.queue import QueueClient
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from config import settings
+from data_models import MessageEnvelope
 import os
-import base64
 import json
 from datetime import datetime, timezone
 
+class QueueClientPool:
+    """
+    One QueueClient per (connection string, queue name), created on first use and reused
+    for every later receive/delete/send. All clients share one RequestsTransport, so
+    requests to any queue of the account go over the same warm keep-alive connections
+    instead of a new pipeline and TLS handshake per send.
+    """
+
+    def __init__(self, pool_maxsize: int):
+        self.pool_maxsize = pool_maxsize
+        self._clients: Dict[Tuple[str, str], QueueClient] = {}
+        self._transport: Optional[RequestsTransport] = None
+        self._lock = threading.Lock()
+
+    def _create_transport(self) -> RequestsTransport:
+        session = requests.Session()
+        # The SDK retries through its own policy, so the adapter must not retry as well
+        adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize, max_retries=Retry(total=False, redirect=False, raise_on_status=False))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return RequestsTransport(session=session, session_owner=False)
+
+    def get(self, conn_str: str, queue_name: str) -> QueueClient:
+        """Returns the pooled client for queue_name, creating it on first use."""
+        key = (conn_str, queue_name)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self._transport is None:
+                    self._transport = self._create_transport()
+                logging.info(f"🔗 PROCESSING: Creating pooled QueueClient for queue '{queue_name}'")
+                client = QueueClient.from_connection_string(conn_str, queue_name, transport=self._transport)
+                self._clients[key] = client
+            return client
+
+
+queue_client_pool = QueueClientPool(settings.QUEUE_HTTP_POOL_SIZE)
+
+
 class AzureQueueService:
     def __init__(self, conn_str: str, queue_name: str):
         """Initialize Azure Queue Service with extensive logging"""
         
         init_start_time = time.time()
+        self.lease_extensions = 0
+        self.leases_lost = 0
+        self.leased_not_started = 0
+        self.leases_released = 0
+        self.lease_estimator = LeaseCostEstimator()
+        self._lease_stats_lock = threading.Lock()
         logging.info("🔗 INITIALIZING: Azure Queue Service")
         logging.info(f"📋 Target queue name: {queue_name}")
         
         try:
             # Initialize queue client
             logging.info("🔄 PROCESSING: Creating QueueClient connection")
-            self.queue_client = QueueClient.from_connection_string(conn_str, queue_name)
+            self.queue_client = queue_client_pool.get(conn_str, queue_name)
             
             # Test connection
             logging.info("🔍 VALIDATING: Testing queue connection")
@@ -51,8 +101,14 @@ class AzureQueueService:
             logging.error(f"❌ FAILURE: Could not create artifacts directory: {settings.ARTIFACTS_DIR}")
             logging.error(f"📊 Error: {e}")
 
-    def receive_messages(self, max_messages: int) -> List[Any]:
-        """Receive messages from queue with extensive logging"""
+    def receive_messages(self, max_messages: int, visibility_timeout: Optional[int] = None) -> List[Any]:
+        """
+        Receive up to max_messages from queue with extensive logging.
+        Only a single page is requested, so no more than max_messages are leased; the
+        visibility timeout defaults to the lease estimator's estimate of one message's cost.
+        """
+        if visibility_timeout is None:
+            visibility_timeout = self.lease_estimator.visibility_timeout()
         
         receive_start_time = time.time()
         logging.debug(f"📥 PROCESSING: Receiving up to {max_messages} messages from queue")
@@ -62,14 +118,17 @@ class AzureQueueService:
             logging.debug("📡 EXECUTING: Queue receive operation")
             poll_start_time = time.time()
             
-            messages = self.queue_client.receive_messages(messages_per_page=max_messages, visibility_timeout=300)
-            msg_list = list(messages)
+            messages = self.queue_client.receive_messages(messages_per_page=max_messages, visibility_timeout=visibility_timeout)
+            # First page only: iterating the whole pager keeps leasing pages until the queue is empty
+            msg_list = list(next(messages.by_page(), []))
+            with self._lease_stats_lock:
+                self.leased_not_started += len(msg_list)
             
             poll_duration = time.time() - poll_start_time
             
             if msg_list:
                 logging.info(f"✅ SUCCESS: Retrieved {len(msg_list)} messages in {poll_duration:.2f} seconds")
-                logging.info(f"📊 Visibility timeout: 300 seconds")
+                logging.info(f"📊 Visibility timeout: {visibility_timeout} seconds")
                 
                 # Log message IDs for tracking
                 message_ids = [getattr(msg, 'id', 'N/A') for msg in msg_list]
@@ -102,25 +161,26 @@ class AzureQueueService:
                         content_length = len(msg.content)
                         logging.debug(f"📊 Raw content length: {content_length} characters")
                         
-                        # Try to decode base64 content to JSON if possible
+                        # Decode once; the envelope travels with the message to the processing stages
                         try:
                             logging.debug("🔄 PROCESSING: Attempting base64 decode and JSON parse")
-                            decoded = base64.b64decode(msg.content).decode('utf-8')
-                            json_obj = json.loads(decoded)
-                            
-                            json_path = raw_path.replace('.txt', '.decoded.json')
-                            with open(json_path, 'w', encoding='utf-8') as jf:
-                                json.dump(json_obj, jf, indent=2)
-                            
-                            logging.info(f"✅ SUCCESS: Saved decoded JSON to {os.path.basename(json_path)}")
-                            
+                            envelope = MessageEnvelope.decode(msg.content)
+                            msg.envelope = envelope
+                            json_obj = envelope.fields
+
+                            json_path = raw_path.replace('.txt', '.decoded.json' if envelope.encoding == "base64" else '.direct.json')
+                            with open(json_path, 'wb') as jf:
+                                jf.write(envelope.payload_bytes())
+
+                            logging.info(f"✅ SUCCESS: Saved {envelope.encoding} JSON to {os.path.basename(json_path)} (decoded in {envelope.decode_seconds * 1000:.1f} ms)")
+
                             # Log the top-level keys for quick inspection
                             if isinstance(json_obj, dict):
                                 keys = list(json_obj.keys())[:10]  # Limit to first 10 keys
                                 logging.info(f"📋 Decoded JSON keys: {', '.join(keys)}")
                                 if len(json_obj.keys()) > 10:
                                     logging.info(f"📊 Total keys: {len(json_obj.keys())} (showing first 10)")
-                                    
+
                                 # Log important fields if present
                                 important_fields = ['UploadDatasheetid', 'ClientFileName', 'BatchId', 'DocReceivedId']
                                 for field in important_fields:
@@ -129,20 +189,9 @@ class AzureQueueService:
                                         logging.info(f"📋 {field}: {value}")
                             else:
                                 logging.info(f"📊 Decoded JSON type: {type(json_obj)}")
-                                
+
                         except Exception as decode_e:
-                            logging.debug(f"ℹ️ INFO: Message not base64-encoded JSON: {decode_e}")
-                            
-                            # Try direct JSON parse
-                            try:
-                                logging.debug("🔄 PROCESSING: Attempting direct JSON parse")
-                                json_obj = json.loads(msg.content)
-                                json_path = raw_path.replace('.txt', '.direct.json')
-                                with open(json_path, 'w', encoding='utf-8') as jf:
-                                    json.dump(json_obj, jf, indent=2)
-                                logging.info(f"✅ SUCCESS: Saved direct JSON to {os.path.basename(json_path)}")
-                            except Exception:
-                                logging.debug("ℹ️ INFO: Message content is not JSON format")
+                            logging.debug(f"ℹ️ INFO: Message content is not JSON format: {decode_e}")
 
                     except Exception as e:
                         logging.error(f"❌ FAILURE: Failed to save received message {i+1} to artifacts: {e}")
@@ -164,6 +213,41 @@ class AzureQueueService:
             logging.error(f"📊 Error type: {type(e).__name__}")
             return []
 
+    def keep_alive(self, message: Any) -> "LeaseHeartbeat":
+        """Returns a heartbeat that keeps message invisible while it is being processed (use as a context manager)."""
+        return LeaseHeartbeat(self, message, settings.QUEUE_VISIBILITY_TIMEOUT, settings.LEASE_RENEWAL_INTERVAL)
+
+    def mark_started(self) -> None:
+        """Called when a leased message starts processing."""
+        with self._lease_stats_lock:
+            self.leased_not_started = max(0, self.leased_not_started - 1)
+
+    def release_message(self, message: Any, pop_receipt: Optional[str] = None) -> None:
+        """Makes a leased message that will not be processed visible again immediately (pop_receipt: latest, if renewed)."""
+        with self._lease_stats_lock:
+            self.leased_not_started = max(0, self.leased_not_started - 1)
+        try:
+            self.queue_client.update_message(message.id, pop_receipt=pop_receipt or message.pop_receipt, visibility_timeout=0)
+            with self._lease_stats_lock:
+                self.leases_released += 1
+            logging.info(f"↩️ LEASE: Released unstarted message {message.id} back to the queue")
+        except Exception as e:
+            logging.warning(f"⚠️ WARNING: Could not release message {message.id}; it becomes visible when its lease expires: {e}")
+
+    def record_lease_extension(self) -> None:
+        with self._lease_stats_lock:
+            self.lease_extensions += 1
+
+    def record_lease_lost(self) -> None:
+        with self._lease_stats_lock:
+            self.leases_lost += 1
+
+    def lease_stats(self) -> str:
+        with self._lease_stats_lock:
+            return (f"{self.lease_extensions} lease extensions, {self.leases_lost} leases lost, "
+                    f"{self.leased_not_started} leased but not started, {self.leases_released} released, "
+                    f"next visibility timeout {self.lease_estimator.visibility_timeout()}s")
+
     def delete_message(self, message_id: str, pop_receipt: str):
         """Delete message from queue with extensive logging"""
         
@@ -247,11 +331,11 @@ class AzureQueueService:
             transmission_start_time = time.time()
             
             if target_queue_name:
-                logging.info("🔄 PROCESSING: Creating target queue client")
+                logging.info("🔄 PROCESSING: Getting pooled target queue client")
                 if not settings.AZURE_STORAGE_CONNECTION_STRING:
                     raise ValueError("Azure Storage connection string not available")
                     
-                target_client = QueueClient.from_connection_string(settings.AZURE_STORAGE_CONNECTION_STRING, target_queue_name)
+                target_client = queue_client_pool.get(settings.AZURE_STORAGE_CONNECTION_STRING, target_queue_name)
                 
                 logging.debug("📡 EXECUTING: Sending message to target queue")
                 target_client.send_message(message)
@@ -279,4 +363,98 @@ class AzureQueueService:
             logging.error(f"📊 Message length: {len(message)} characters")
             logging.error(f"📊 Error: {e}")
             logging.error(f"📊 Error type: {type(e).__name__}")
-            raise
\ No newline at end of file
+            raise
+
+
+class LeaseCostEstimator:
+    """
+    Exponentially weighted moving average of per-message processing time, used to size
+    the visibility timeout of new leases. Until the first sample arrives (and never above
+    it) the lease is QUEUE_VISIBILITY_TIMEOUT; the heartbeat extends leases that run long.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.average_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            if self.average_seconds is None:
+                self.average_seconds = seconds
+            else:
+                self.average_seconds = self.alpha * seconds + (1 - self.alpha) * self.average_seconds
+
+    def visibility_timeout(self) -> int:
+        with self._lock:
+            average_seconds = self.average_seconds
+        if average_seconds is None:
+            return settings.QUEUE_VISIBILITY_TIMEOUT
+        estimate = int(average_seconds * settings.LEASE_COST_MARGIN) + 1
+        return max(settings.LEASE_MIN_VISIBILITY_TIMEOUT, min(estimate, settings.QUEUE_VISIBILITY_TIMEOUT))
+
+
+class LeaseHeartbeat:
+    """
+    Background thread that extends a leased message's visibility timeout with
+    update_message while it is being processed, so a long OCR run does not make the
+    message visible to other replicas. Each update returns a new pop receipt; the
+    latest one is kept in pop_receipt for the final delete_message.
+    """
+
+    def __init__(self, queue_service: AzureQueueService, message: Any, visibility_timeout: int, renewal_interval: int):
+        self.queue_service = queue_service
+        self.message_id = message.id
+        self.pop_receipt = message.pop_receipt
+        self.visibility_timeout = visibility_timeout
+        # Renew well before expiry so one failed update can still be retried in time
+        self.renewal_interval = max(1, min(renewal_interval, visibility_timeout // 2))
+        # The first renewal must beat the (possibly shorter, estimate-sized) lease taken at receive time
+        next_visible_on = getattr(message, 'next_visible_on', None)
+        self.visible_until = next_visible_on.timestamp() if next_visible_on else time.time() + visibility_timeout
+        self.extensions = 0
+        self.lost = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.message_id}", daemon=True)
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self.start()
+        return self
+
+    def start(self) -> None:
+        """Starts renewing; a no-op if already started (prefetched messages are kept alive before processing)."""
+        if not self._thread.is_alive() and not self._stop_event.is_set():
+            try:
+                self._thread.start()
+            except RuntimeError:
+                pass  # Already started and finished
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def stop(self) -> None:
+        """Stops renewing; waits for an in-flight update so pop_receipt is final."""
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(min(self.renewal_interval, max(1.0, (self.visible_until - time.time()) / 2))):
+            try:
+                updated = self.queue_service.queue_client.update_message(
+                    self.message_id, pop_receipt=self.pop_receipt, visibility_timeout=self.visibility_timeout
+                )
+                self.pop_receipt = updated.pop_receipt
+                self.visible_until = time.time() + self.visibility_timeout
+                self.extensions += 1
+                self.queue_service.record_lease_extension()
+                logging.info(f"⏳ LEASE: Extended message {self.message_id} by {self.visibility_timeout}s (extension #{self.extensions})")
+            except Exception as e:
+                # 404 (message gone) and 400 (pop receipt mismatch) mean another consumer owns it now
+                status_code = getattr(e, 'status_code', None)
+                if status_code in (400, 404) or time.time() >= self.visible_until:
+                    self.lost = True
+                    self.queue_service.record_lease_lost()
+                    logging.error(f"❌ LEASE LOST: Message {self.message_id} may be processed again by another replica: {e}")
+                    return
+                logging.warning(f"⚠️ WARNING: Lease renewal failed for message {self.message_id}, retrying: {e}")
@@ -0,0 +1,69 @@
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from azure.storage.blob import BlobServiceClient
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_blob_service_client: Optional[BlobServiceClient] = None
+_client_lock = threading.Lock()
+
+
+def blob_reference(message_content: dict) -> Optional[Tuple[str, str]]:
+    """
+    (container, blob name) of a claim-check message: BlobName, in BlobContainer or
+    BLOB_CONTAINER_NAME by default. None if the message carries no blob reference.
+    """
+    blob_name = message_content.get("BlobName")
+    if not blob_name:
+        return None
+    return message_content.get("BlobContainer") or settings.BLOB_CONTAINER_NAME, blob_name
+
+
+def get_blob_service_client() -> BlobServiceClient:
+    """
+    Process-wide BlobServiceClient for BLOB_CONNECTION_STRING (an Azurite or local stand-in
+    endpoint works too). Blobs up to DOWNLOAD_PART_SIZE are fetched with a single GET;
+    larger ones continue in DOWNLOAD_PART_SIZE blocks over parallel connections.
+    """
+    global _blob_service_client
+    with _client_lock:
+        if _blob_service_client is None:
+            _blob_service_client = BlobServiceClient.from_connection_string(
+                settings.BLOB_CONNECTION_STRING,
+                max_single_get_size=settings.DOWNLOAD_PART_SIZE,
+                max_chunk_get_size=settings.DOWNLOAD_PART_SIZE,
+                connection_timeout=settings.DOWNLOAD_CONNECT_TIMEOUT,
+                read_timeout=settings.DOWNLOAD_READ_TIMEOUT,
+            )
+        return _blob_service_client
+
+
+def download_blob_to_buffer(container: str, blob_name: str) -> Tuple[bytes, Dict]:
+    """
+    Downloads a blob into memory. Raises azure.core.exceptions.AzureError on failure.
+    Returns the bytes and the same stats as download_client.download_to_buffer
+    (ttfb_seconds is the time until the first block arrived).
+    """
+    start_time = time.time()
+    concurrency = settings.DOWNLOAD_PARALLEL_CONNECTIONS if settings.DOWNLOAD_PARALLEL_ENABLED else 1
+    blob_client = get_blob_service_client().get_blob_client(container, blob_name)
+    downloader = blob_client.download_blob(max_concurrency=concurrency)
+    ttfb_seconds = time.time() - start_time
+    data = downloader.readall()
+
+    remaining = max(0, len(data) - settings.DOWNLOAD_PART_SIZE)
+    parts = 1 + math.ceil(remaining / settings.DOWNLOAD_PART_SIZE)
+    return data, {
+        "bytes": len(data),
+        "seconds": time.time() - start_time,
+        "ttfb_seconds": ttfb_seconds,
+        "mode": "blob",
+        "parts": parts,
+        "resumes": 0,
+    }
@@ -18,6 +18,9 @@ class Settings:
     CLASSIFICATION_QUEUE_NAME: str = os.getenv("CLASSIFICATION_QUEUE_NAME")
     # ADDED: Uncommented and activated BLOB_CONTAINER_NAME
     BLOB_CONTAINER_NAME: str = os.getenv("BLOB_CONTAINER_NAME", "pdfdocuments")
+    # Claim-check messages (BlobName/BlobContainer) are read from this account; defaults to the queue account
+    # (point it at Azurite, e.g. "UseDevelopmentStorage=true", for local tests)
+    BLOB_CONNECTION_STRING: Optional[str] = os.getenv("BLOB_CONNECTION_STRING") or AZURE_STORAGE_CONNECTION_STRING
 
     # API Configuration
     # MODIFIED: Default value updated to match .env file
@@ -29,7 +32,77 @@ class Settings:
     # Application Settings
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", 10))
+    # Keep-alive connections shared by all pooled queue clients (receive, delete, lease renewals and sends)
+    QUEUE_HTTP_POOL_SIZE: int = int(os.getenv("QUEUE_HTTP_POOL_SIZE", 32))
+    # async_main.py: messages downloading / waiting for an OCR slot at once (OCR itself is capped by MAX_CONCURRENT_MESSAGES)
+    ASYNC_MAX_IN_FLIGHT_MESSAGES: int = int(os.getenv("ASYNC_MAX_IN_FLIGHT_MESSAGES", 16))
+    # FilePath downloads: one pooled keep-alive session, retried with exponential backoff on 429/5xx
+    DOWNLOAD_POOL_SIZE: int = int(os.getenv("DOWNLOAD_POOL_SIZE", 10))
+    DOWNLOAD_RETRIES: int = int(os.getenv("DOWNLOAD_RETRIES", 3))
+    DOWNLOAD_BACKOFF_FACTOR: float = float(os.getenv("DOWNLOAD_BACKOFF_FACTOR", 0.5))
+    DOWNLOAD_CONNECT_TIMEOUT: float = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", 10))
+    DOWNLOAD_READ_TIMEOUT: float = float(os.getenv("DOWNLOAD_READ_TIMEOUT", 60))
+    # Files of at least DOWNLOAD_PARALLEL_THRESHOLD bytes are fetched as concurrent byte ranges when the server allows it
+    DOWNLOAD_PARALLEL_ENABLED: bool = os.getenv("DOWNLOAD_PARALLEL_ENABLED", "true").lower() == "true"
+    DOWNLOAD_PARALLEL_THRESHOLD: int = int(os.getenv("DOWNLOAD_PARALLEL_THRESHOLD", 32 * 1024 * 1024))
+    DOWNLOAD_PARALLEL_CONNECTIONS: int = int(os.getenv("DOWNLOAD_PARALLEL_CONNECTIONS", 4))
+    DOWNLOAD_PART_SIZE: int = int(os.getenv("DOWNLOAD_PART_SIZE", 8 * 1024 * 1024))
+    # Maximum lease on a received message; a heartbeat re-extends it every LEASE_RENEWAL_INTERVAL seconds while processing
+    QUEUE_VISIBILITY_TIMEOUT: int = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 300))
+    LEASE_RENEWAL_INTERVAL: int = int(os.getenv("LEASE_RENEWAL_INTERVAL", 100))
+    # New leases are sized to LEASE_COST_MARGIN x the average message time, between the min and QUEUE_VISIBILITY_TIMEOUT
+    LEASE_MIN_VISIBILITY_TIMEOUT: int = int(os.getenv("LEASE_MIN_VISIBILITY_TIMEOUT", 60))
+    LEASE_COST_MARGIN: float = float(os.getenv("LEASE_COST_MARGIN", 2.0))
+    # Polling: immediate re-poll while messages arrive, exponential backoff (with +/- jitter) up to the max when idle
+    POLL_MIN_INTERVAL: float = float(os.getenv("POLL_MIN_INTERVAL", 1.0))
+    POLL_MAX_INTERVAL: float = float(os.getenv("POLL_MAX_INTERVAL", 30.0))
+    POLL_BACKOFF_MULTIPLIER: float = float(os.getenv("POLL_BACKOFF_MULTIPLIER", 2.0))
+    POLL_JITTER: float = float(os.getenv("POLL_JITTER", 0.2))
+    # Messages leased ahead of a free slot (kept alive by the lease heartbeat) so the next document starts at once
+    POLL_PREFETCH_MESSAGES: int = int(os.getenv("POLL_PREFETCH_MESSAGES", 1))
+    # Queue messages (documents) processed concurrently; each document still gets its own page-OCR pool
+    MAX_CONCURRENT_MESSAGES: int = int(os.getenv("MAX_CONCURRENT_MESSAGES", 2))
     TESSERACT_TIMEOUT: int = int(os.getenv("TESSERACT_TIMEOUT", 120)) # Timeout for a single page OCR process
+    # Page-OCR executor: "process" (one PDF handle per worker process) or "thread" (for comparison)
+    OCR_EXECUTOR: str = os.getenv("OCR_EXECUTOR", "process")
+    OCR_DPI: int = int(os.getenv("OCR_DPI", 300))
+    # OCR backend: "pytesseract" (tesseract CLI per page) or "tesserocr" (in-process API handle per worker)
+    OCR_ENGINE: str = os.getenv("OCR_ENGINE", "pytesseract")
+    OCR_LANG: str = os.getenv("OCR_LANG", "eng")
+    # Render pages as 8-bit grayscale (Tesseract binarizes anyway); set to false for RGB renders
+    OCR_GRAYSCALE: bool = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+    # Bounded render pipeline: pages queued per worker before the producer waits for results
+    OCR_PAGES_IN_FLIGHT_PER_WORKER: int = int(os.getenv("OCR_PAGES_IN_FLIGHT_PER_WORKER", 2))
+    # Adaptive resolution: OCR at OCR_LOW_DPI first, re-OCR at OCR_DPI only below the confidence threshold
+    OCR_ADAPTIVE_DPI: bool = os.getenv("OCR_ADAPTIVE_DPI", "false").lower() == "true"
+    OCR_LOW_DPI: int = int(os.getenv("OCR_LOW_DPI", 150))
+    OCR_CONFIDENCE_THRESHOLD: float = float(os.getenv("OCR_CONFIDENCE_THRESHOLD", 75))
+    OCR_FAST_TESSDATA_DIR: str = os.getenv("OCR_FAST_TESSDATA_DIR", "")  # Optional tessdata_fast models for the low-DPI pass
+    # Native text-layer fast path: born-digital pages that pass these checks skip Tesseract
+    TEXT_LAYER_ENABLED: bool = os.getenv("TEXT_LAYER_ENABLED", "true").lower() == "true"
+    TEXT_LAYER_MIN_CHARS: int = int(os.getenv("TEXT_LAYER_MIN_CHARS", 50))
+    TEXT_LAYER_MIN_PRINTABLE_RATIO: float = float(os.getenv("TEXT_LAYER_MIN_PRINTABLE_RATIO", 0.95))
+    TEXT_LAYER_MIN_GLYPH_COVERAGE: float = float(os.getenv("TEXT_LAYER_MIN_GLYPH_COVERAGE", 0.98))
+    # Image-covered pages (scans) need text blocks over this share of the page, or the image body is OCRed
+    TEXT_LAYER_MAX_IMAGE_COVERAGE: float = float(os.getenv("TEXT_LAYER_MAX_IMAGE_COVERAGE", 0.5))
+    TEXT_LAYER_MIN_TEXT_COVERAGE: float = float(os.getenv("TEXT_LAYER_MIN_TEXT_COVERAGE", 0.2))
+    # Blank-page detection on a low-resolution render; blank pages skip OCR and yield empty text
+    BLANK_DETECTION_ENABLED: bool = os.getenv("BLANK_DETECTION_ENABLED", "true").lower() == "true"
+    BLANK_DETECTION_DPI: int = int(os.getenv("BLANK_DETECTION_DPI", 50))
+    BLANK_INK_LEVEL: int = int(os.getenv("BLANK_INK_LEVEL", 160))  # Gray level (0-255) below which a pixel counts as ink
+    BLANK_MAX_INK_RATIO: float = float(os.getenv("BLANK_MAX_INK_RATIO", 0.001))
+    BLANK_MAX_STDDEV: float = float(os.getenv("BLANK_MAX_STDDEV", 12.0))
+    # On-disk OCR result cache keyed by PDF SHA-256 + OCR settings, trimmed LRU-first to OCR_CACHE_MAX_BYTES
+    OCR_CACHE_ENABLED: bool = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+    OCR_CACHE_DIR: str = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+    OCR_CACHE_MAX_BYTES: int = int(os.getenv("OCR_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    # Per-page dedup: identical pages (by content fingerprint) are OCRed once; results shared across documents
+    PAGE_DEDUP_ENABLED: bool = os.getenv("PAGE_DEDUP_ENABLED", "true").lower() == "true"
+    PAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 5000))
+    # Compiled demarcation rule sets (parsed Identifiers + identifier automaton), reused by messages with the same rules
+    RULESET_CACHE_MAX_ENTRIES: int = int(os.getenv("RULESET_CACHE_MAX_ENTRIES", 256))
+    # PDFs are OCRed from memory; the artifact copy in the message folder is written in the background (or skipped)
+    SAVE_PDF_ARTIFACT: bool = os.getenv("SAVE_PDF_ARTIFACT", "true").lower() == "true"
     # Local folder to store artifacts (received messages, downloaded files, outgoing messages)
     ARTIFACTS_DIR: str = os.getenv("ARTIFACTS_DIR", "artifacts")
     # Skip API call and send directly to classification queue (useful when API is down)
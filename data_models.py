@@ -1,9 +1,78 @@
+import base64
+import json
 import logging
+import time
 import traceback
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 from lxml import etree
 
 
+class MessageEnvelope:
+    """
+    A queue message decoded once at receive time and passed through the pipeline as is.
+
+    fields is the parsed message; body is the JSON it was parsed from (the UTF-8 bytes of a
+    base64 message, or the message text itself), kept only until write_payload() has saved it
+    verbatim. The embedded PdfContent stays base64 text until pdf_bytes() is first called, and
+    decode times and sizes are kept for the per-message logs.
+    """
+
+    def __init__(self, fields: Dict[str, Any], body: Union[bytes, str, None] = None, encoding: str = "fields", decode_seconds: float = 0.0):
+        self.fields = fields
+        self.body = body
+        self.body_size = len(body) if body is not None else 0
+        self.encoding = encoding  # "base64", "json", or "fields" when built from an already-parsed dict
+        self.decode_seconds = decode_seconds
+        self.pdf_decode_seconds = 0.0
+        self._pdf_bytes: Optional[bytes] = None
+
+    @classmethod
+    def decode(cls, content: str) -> "MessageEnvelope":
+        """Parses a queue message body as base64 JSON, falling back to plain JSON (raises json.JSONDecodeError)."""
+        start = time.perf_counter()
+        try:
+            body = base64.b64decode(content)
+            fields = json.loads(body)  # json detects the UTF-8 bytes; no intermediate str copy
+            encoding = "base64"
+        except Exception:
+            body = content
+            fields = json.loads(content)
+            encoding = "json"
+        return cls(fields, body, encoding, time.perf_counter() - start)
+
+    @property
+    def has_embedded_pdf(self) -> bool:
+        return bool(self.fields.get("PdfContent"))
+
+    def pdf_bytes(self) -> bytes:
+        """The embedded PDF, base64-decoded on first use (raises binascii.Error on bad content)."""
+        if self._pdf_bytes is None:
+            start = time.perf_counter()
+            self._pdf_bytes = base64.b64decode(self.fields["PdfContent"])
+            self.pdf_decode_seconds = time.perf_counter() - start
+        return self._pdf_bytes
+
+    def write_payload(self, path: str) -> None:
+        """Writes payload_bytes() to path, then releases the body (the processing stages only need fields)."""
+        with open(path, 'wb') as f:
+            f.write(self.payload_bytes())
+        self.body = None
+
+    def payload_bytes(self) -> bytes:
+        """The message JSON as received; serialized from fields only when there is no body (built from a dict, or released)."""
+        if self.body is None:
+            return json.dumps(self.fields, ensure_ascii=False, indent=2).encode('utf-8')
+        if isinstance(self.body, str):
+            return self.body.encode('utf-8')
+        return self.body
+
+    def decode_stats(self) -> str:
+        stats = f"body {self.decode_seconds * 1000:.1f} ms ({self.encoding}, {self.body_size:,} long)"
+        if self._pdf_bytes is not None:
+            stats += f", PdfContent {self.pdf_decode_seconds * 1000:.1f} ms ({len(self._pdf_bytes):,} bytes)"
+        return stats
+
+
 def create_subdocument_xml(rows: List[Dict[str, Any]]) -> str:
     """Creates the XML payload from a list of sub-document row data.
 
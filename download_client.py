@@ -0,0 +1,264 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'iPerform-OCR-Processor/1.0'
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=settings.DOWNLOAD_RETRIES,
+        backoff_factor=settings.DOWNLOAD_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # The last response is returned and raise_for_status() reports it
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.DOWNLOAD_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_download_session() -> requests.Session:
+    """
+    Process-wide session for FilePath downloads. All inputs come from the same file host,
+    so keep-alive connections are pooled and reused across messages, and 429/5xx responses
+    and connection errors are retried with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def download_timeout() -> tuple:
+    """(connect, read) timeouts; the read timeout applies between bytes, not to the whole transfer."""
+    return (settings.DOWNLOAD_CONNECT_TIMEOUT, settings.DOWNLOAD_READ_TIMEOUT)
+
+
+class RangeNotSupportedError(requests.exceptions.RequestException):
+    """The server ignored a Range request (or the file changed between parts)."""
+
+
+class FileSink:
+    """Writes downloaded bytes at their offsets into a file, preallocated when the size is known."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def preallocate(self, size: int) -> None:
+        with self._lock:
+            self._file.truncate(size)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate(0)
+            self.size = 0
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(data)
+            self.size = max(self.size, offset + len(data))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BufferSink:
+    """Writes downloaded bytes at their offsets into an in-memory bytearray."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def preallocate(self, size: int) -> None:
+        with self._lock:
+            self.buffer = bytearray(size)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.buffer = bytearray()
+            self.size = 0
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        end = offset + len(data)
+        with self._lock:
+            if end > len(self.buffer):
+                self.buffer.extend(bytes(end - len(self.buffer)))
+            self.buffer[offset:end] = data
+            self.size = max(self.size, end)
+
+    def close(self) -> None:
+        pass
+
+
+def _probe(url: str) -> Tuple[Optional[int], bool, Optional[str]]:
+    """HEAD request: (size, accepts byte ranges, validator for If-Range); (None, False, None) if unavailable."""
+    try:
+        with get_download_session().head(url, allow_redirects=True, timeout=download_timeout()) as response:
+            if response.status_code >= 400:
+                return None, False, None
+            length = response.headers.get("Content-Length", "")
+            size = int(length) if length.isdigit() else None
+            accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return size, accepts_ranges, _validator(response)
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"ℹ️ INFO: HEAD request failed, using a single stream: {e}")
+        return None, False, None
+
+
+def _validator(response: requests.Response) -> Optional[str]:
+    """Strong ETag or Last-Modified, so resumed/ranged reads fail instead of mixing two versions of a file."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _fetch_into(url: str, sink, stats: Dict, start: int = 0, end: Optional[int] = None,
+                validator: Optional[str] = None, can_resume: bool = False) -> None:
+    """
+    Fetches bytes [start, end] (end None: to the end of the file) into sink at their offsets.
+    An interrupted transfer is resumed from the last received byte with a Range request,
+    up to DOWNLOAD_RETRIES times, when the server supports ranges.
+    """
+    session = get_download_session()
+    offset = start
+    resumes = 0
+    while True:
+        headers = {}
+        if offset > 0 or end is not None:
+            headers["Range"] = f"bytes={offset}-{'' if end is None else end}"
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=download_timeout()) as response:
+                if not headers:
+                    logger.info(f"📊 HTTP Response: {response.status_code} {response.reason}")
+                response.raise_for_status()
+                if headers and response.status_code != 206:
+                    raise RangeNotSupportedError(f"Expected 206 for {headers['Range']}, got {response.status_code}")
+                if not headers:
+                    can_resume = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+                    validator = _validator(response)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    if end is not None:
+                        chunk = chunk[:end + 1 - offset]
+                    if stats["ttfb_seconds"] is None:
+                        stats["ttfb_seconds"] = time.time() - stats["start_time"]
+                    sink.write_at(offset, chunk)
+                    offset += len(chunk)
+                    if end is not None and offset > end:
+                        break
+            if end is not None and offset <= end:
+                raise requests.exceptions.ChunkedEncodingError(f"Range ended early at byte {offset:,} of {end:,}")
+            return
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout) as e:
+            resumes += 1
+            if not can_resume or resumes > settings.DOWNLOAD_RETRIES:
+                raise
+            with _stats_lock:
+                stats["resumes"] += 1
+            logger.warning(f"⚠️ WARNING: Download interrupted at byte {offset:,} ({e}); resuming with a Range request")
+            time.sleep(settings.DOWNLOAD_BACKOFF_FACTOR * (2 ** (resumes - 1)))
+
+
+def _ranged_download(url: str, sink, size: int, validator: Optional[str], stats: Dict) -> None:
+    """Splits [0, size) into DOWNLOAD_PART_SIZE ranges fetched over DOWNLOAD_PARALLEL_CONNECTIONS connections."""
+    part_size = max(DOWNLOAD_CHUNK_SIZE, min(settings.DOWNLOAD_PART_SIZE, math.ceil(size / settings.DOWNLOAD_PARALLEL_CONNECTIONS)))
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    stats["parts"] = len(ranges)
+    sink.preallocate(size)
+    with ThreadPoolExecutor(max_workers=settings.DOWNLOAD_PARALLEL_CONNECTIONS, thread_name_prefix="download") as pool:
+        futures = [pool.submit(_fetch_into, url, sink, stats, start, end, validator, True) for start, end in ranges]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            # Don't start the remaining parts once one has failed
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _download(url: str, sink) -> Dict:
+    """
+    Downloads url into sink: concurrent byte ranges for files of at least
+    DOWNLOAD_PARALLEL_THRESHOLD bytes on servers that accept ranges, a single
+    (resumable) stream otherwise or when a ranged fetch is refused.
+    """
+    stats = {"start_time": time.time(), "ttfb_seconds": None, "mode": "stream", "parts": 1, "resumes": 0}
+    if settings.DOWNLOAD_PARALLEL_ENABLED:
+        size, accepts_ranges, validator = _probe(url)
+        if accepts_ranges and size and size >= settings.DOWNLOAD_PARALLEL_THRESHOLD:
+            logger.info(f"📡 PROCESSING: Ranged download of {size:,} bytes over {settings.DOWNLOAD_PARALLEL_CONNECTIONS} connections")
+            try:
+                _ranged_download(url, sink, size, validator, stats)
+                stats["mode"] = "ranged"
+            except RangeNotSupportedError as e:
+                logger.warning(f"⚠️ WARNING: Ranged download refused ({e}); falling back to a single stream")
+                sink.reset()
+                stats.update(ttfb_seconds=None, parts=1)
+                _fetch_into(url, sink, stats)
+        else:
+            _fetch_into(url, sink, stats)
+    else:
+        _fetch_into(url, sink, stats)
+
+    seconds = time.time() - stats["start_time"]
+    return {
+        "bytes": sink.size,
+        "seconds": seconds,
+        "ttfb_seconds": stats["ttfb_seconds"] if stats["ttfb_seconds"] is not None else seconds,
+        "mode": stats["mode"],
+        "parts": stats["parts"],
+        "resumes": stats["resumes"],
+    }
+
+
+def download_to_file(url: str, path: str) -> Dict:
+    """
+    Downloads url into path. Raises requests.exceptions.RequestException on failure.
+    Returns bytes, seconds, ttfb_seconds (request start to first body byte), mode, parts and resumes.
+    """
+    sink = FileSink(path)
+    try:
+        return _download(url, sink)
+    finally:
+        sink.close()
+
+
+def download_to_buffer(url: str) -> Tuple[bytearray, Dict]:
+    """Downloads url into memory; returns the bytes and the same stats as download_to_file."""
+    sink = BufferSink()
+    stats = _download(url, sink)
+    return sink.buffer, stats
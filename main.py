@@ -4,294 +4,438 @@ import logging
 import time
 import signal
 import threading
-import base64
+import math
 import requests
 import sys
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timezone
+from typing import Optional
 
-# Setup logging FIRST before any other imports
-# Create logs directory if it doesn't exist
-logs_dir = "logs"
-os.makedirs(logs_dir, exist_ok=True)
-
-# Create log filename with timestamp
-log_filename = os.path.join(logs_dir, f"ocr_processor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-# Configure logging to both file and console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Graceful shutdown event used by the main loop and long sleeps
 shutdown_event = threading.Event()
 
-from azure_service import AzureQueueService
-from ocr_processor import get_text_from_pdf, demarcate_document
-from data_models import create_subdocument_xml
+from azure_service import AzureQueueService, LeaseHeartbeat
+from ocr_processor import LOG_FORMAT, extract_pages_from_pdf, demarcate_document, shutdown_page_pools
+from data_models import create_subdocument_xml, MessageEnvelope
+from download_client import download_to_buffer
+from blob_service import blob_reference, download_blob_to_buffer
+from azure.core.exceptions import AzureError
 from config import settings
 
+# Azure Queue Storage returns at most 32 messages per receive call
+MAX_MESSAGES_PER_RECEIVE = 32
+
+# PDF artifact copies are written off the OCR path; the interpreter joins this thread at exit.
+# Created on first use, so importing this module (as OCR worker processes do) starts no threads.
+_artifact_writer: Optional[ThreadPoolExecutor] = None
+_artifact_writer_lock = threading.Lock()
+
+
+def setup_logging() -> str:
+    """
+    Logs to the console and to a timestamped file under logs/; returns the log file path.
+    Called by the entry points only, so worker processes importing this module don't open log files of their own.
+    """
+    logs_dir = "logs"
+    os.makedirs(logs_dir, exist_ok=True)
+    log_filename = os.path.join(logs_dir, f"ocr_processor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    # force replaces the console-only configuration set up when ocr_processor was imported
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=[
+            logging.FileHandler(log_filename),
+            logging.StreamHandler()
+        ],
+        force=True
+    )
+    return log_filename
+
 
 def _handle_signal(signum, frame):
     logger.info(f"🔔 SIGNAL: Received signal {signum}, initiating graceful shutdown")
     shutdown_event.set()
 
-# Register signal handlers (works on Linux containers)
-signal.signal(signal.SIGINT, _handle_signal)
-try:
-    signal.signal(signal.SIGTERM, _handle_signal)
-except Exception:
-    # SIGTERM may not be available on some platforms; ignore if registration fails
-    pass
 
-def process_message(message_content: dict, input_queue_service: AzureQueueService, output_queue_service: AzureQueueService) -> bool:
-    """Process a single queue message for OCR"""
-    
-    process_start_time = time.time()
+def install_signal_handlers() -> None:
+    """Turns SIGINT/SIGTERM into a graceful shutdown (works on Linux containers)."""
+    signal.signal(signal.SIGINT, _handle_signal)
+    try:
+        signal.signal(signal.SIGTERM, _handle_signal)
+    except Exception:
+        # SIGTERM may not be available on some platforms; ignore if registration fails
+        pass
+
+
+def artifact_writer() -> ThreadPoolExecutor:
+    """The background writer for PDF artifact copies, started on first use."""
+    global _artifact_writer
+    with _artifact_writer_lock:
+        if _artifact_writer is None:
+            _artifact_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact")
+        return _artifact_writer
+
+def start_message(message_content: dict) -> Optional[dict]:
+    """
+    Stage 1: creates the message's artifacts folder and validates the message fields.
+    Returns the per-message context used by the later stages, or None if the message is invalid.
+    """
     upload_id = message_content.get("UploadDatasheetid", "UNKNOWN")
     timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
     # Create a unique subfolder for this message in the artifacts directory
     message_folder = os.path.join(settings.ARTIFACTS_DIR, f"{upload_id}_{timestamp}")
     os.makedirs(message_folder, exist_ok=True)
-    
+    context = {
+        "process_start_time": time.time(),
+        "upload_id": upload_id,
+        "timestamp": timestamp,
+        "message_folder": message_folder,
+    }
+
     logger.info("🚀 STARTING MESSAGE PROCESSING")
     logger.info(f"📋 UploadDatasheetid: {upload_id}")
     logger.info(f"⏰ Process start time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
+
+    # 📁 ARTIFACTS DIRECTORY SETUP
     try:
-        # 📁 ARTIFACTS DIRECTORY SETUP
-        try:
-            os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
-            os.makedirs(message_folder, exist_ok=True)
-            logger.info(f"✅ SUCCESS: Artifacts directory ready: {settings.ARTIFACTS_DIR}")
-            logger.info(f"✅ SUCCESS: Message-specific folder ready: {message_folder}")
-        except Exception as e:
-            logger.error(f"❌ CRITICAL FAILURE: Could not create artifacts directory: {settings.ARTIFACTS_DIR} or message folder: {message_folder} - {e}")
-            return False
+        os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
+        os.makedirs(message_folder, exist_ok=True)
+        logger.info(f"✅ SUCCESS: Artifacts directory ready: {settings.ARTIFACTS_DIR}")
+        logger.info(f"✅ SUCCESS: Message-specific folder ready: {message_folder}")
+    except Exception as e:
+        logger.error(f"❌ CRITICAL FAILURE: Could not create artifacts directory: {settings.ARTIFACTS_DIR} or message folder: {message_folder} - {e}")
+        return None
+
+    # ✅ SUCCESS: Message received
+    logger.info("✅ SUCCESS: Message received successfully")
+
+    # Log the full message content for debugging
+    logger.info("=" * 80)
+    logger.info("RECEIVED MESSAGE CONTENT:")
+    logger.info("=" * 80)
+    for key, value in message_content.items():
+        if isinstance(value, str) and len(value) > 200:
+            logger.info(f"{key}: {value[:200]}... (truncated, length: {len(value)})")
+        else:
+            logger.info(f"{key}: {value}")
+    logger.info("=" * 80)
 
-        # ✅ SUCCESS: Message received
-        logger.info("✅ SUCCESS: Message received successfully")
+    # 🔍 VALIDATION: Check for required fields
+    logger.info("🔍 VALIDATING: Checking required message fields")
 
-        # Log the full message content for debugging
-        logger.info("=" * 80)
-        logger.info("RECEIVED MESSAGE CONTENT:")
-        logger.info("=" * 80)
-        for key, value in message_content.items():
-            if isinstance(value, str) and len(value) > 200:
-                logger.info(f"{key}: {value[:200]}... (truncated, length: {len(value)})")
-            else:
-                logger.info(f"{key}: {value}")
-        logger.info("=" * 80)
+    client_filename = message_content.get("ClientFileName")
+    if not client_filename:
+        logger.error("❌ FAILURE: Message validation failed - missing 'ClientFileName'")
+        logger.error(f"📋 Available fields: {list(message_content.keys())}")
+        return None
 
-        # 🔍 VALIDATION: Check for required fields
-        logger.info("🔍 VALIDATING: Checking required message fields")
+    logger.info(f"✅ SUCCESS: ClientFileName found: {client_filename}")
+    context["client_filename"] = client_filename
 
-        client_filename = message_content.get("ClientFileName")
-        if not client_filename:
-            logger.error("❌ FAILURE: Message validation failed - missing 'ClientFileName'")
-            logger.error(f"📋 Available fields: {list(message_content.keys())}")
-            return False
+    # Validate other required fields
+    required_fields = ["UploadDatasheetid", "DocReceivedId", "BatchId"]
+    missing_fields = []
+    for field in required_fields:
+        if field not in message_content or message_content[field] is None:
+            missing_fields.append(field)
 
-        logger.info(f"✅ SUCCESS: ClientFileName found: {client_filename}")
+    if missing_fields:
+        logger.warning(f"⚠️ WARNING: Missing optional fields: {missing_fields}")
+    else:
+        logger.info("✅ SUCCESS: All required fields present")
 
-        # Validate other required fields
-        required_fields = ["UploadDatasheetid", "DocReceivedId", "BatchId"]
-        missing_fields = []
-        for field in required_fields:
-            if field not in message_content or message_content[field] is None:
-                missing_fields.append(field)
+    logger.info(f"🔄 PROCESSING: Starting file processing for {client_filename}")
+    return context
 
-        if missing_fields:
-            logger.warning(f"⚠️ WARNING: Missing optional fields: {missing_fields}")
-        else:
-            logger.info("✅ SUCCESS: All required fields present")
 
-        logger.info(f"🔄 PROCESSING: Starting file processing for {client_filename}")
+def save_payload(context: dict, envelope: MessageEnvelope) -> None:
+    """Saves the original payload JSON in the message folder, as received (no re-serialization)."""
+    envelope.write_payload(os.path.join(context["message_folder"], "payload.json"))
 
-        # 📄 PDF CONTENT PROCESSING
-        logger.info("📄 PROCESSING: Checking for PDF content in message")
-        pdf_content = message_content.get("PdfContent")
-        pdf_url = message_content.get("FilePath")
-        pdf_path = None # Initialize pdf_path
 
-        if pdf_content:
-            logger.info("✅ SUCCESS: PDF content found in message (embedded base64)")
-            try:
-                logger.info("🔄 PROCESSING: Decoding base64 PDF content")
-                pdf_data = base64.b64decode(pdf_content)
-                logger.info(f"✅ SUCCESS: PDF content decoded, size: {len(pdf_data)} bytes")
-                # Save the original payload JSON in the message folder
-                payload_json_path = os.path.join(message_folder, "payload.json")
-                with open(payload_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(message_content, f, ensure_ascii=False, indent=2)
-                # Create a permanent path in the message folder
-                pdf_filename = f"{upload_id}_{timestamp}_from_message.pdf"
-                pdf_path = os.path.join(message_folder, pdf_filename)
-                logger.info(f"💾 PROCESSING: Saving PDF to local artifacts: {pdf_path}")
-                with open(pdf_path, 'wb') as f:
-                    f.write(pdf_data)
-                logger.info(f"✅ SUCCESS: PDF content saved locally.")
-            except Exception as e:
-                logger.error(f"❌ FAILURE: Failed to decode or save PDF content: {e}")
-                return False
-        
-        elif pdf_url:
-            logger.info("✅ SUCCESS: PDF URL found in message (FilePath)")
-            logger.info(f"🔗 PDF URL: {pdf_url}")
-            try:
-                logger.info("🌐 PROCESSING: Starting PDF download from URL")
-                download_start_time = time.time()
-                session = requests.Session()
-                session.headers.update({'User-Agent': 'iPerform-OCR-Processor/1.0'})
-                response = session.get(pdf_url, stream=True, timeout=60)
-                logger.info(f"📊 HTTP Response: {response.status_code} {response.reason}")
-                response.raise_for_status() # Raise an exception for bad status codes
-                # Save the original payload JSON in the message folder
-                payload_json_path = os.path.join(message_folder, "payload.json")
-                with open(payload_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(message_content, f, ensure_ascii=False, indent=2)
-                # Create a permanent path for the downloaded PDF in the message folder
-                pdf_filename = f"{upload_id}_{timestamp}_from_url.pdf"
-                pdf_path = os.path.join(message_folder, pdf_filename)
-                logger.info(f"💾 PROCESSING: Saving downloaded PDF to: {pdf_path}")
-                with open(pdf_path, 'wb') as f:
-                    downloaded_bytes = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_bytes += len(chunk)
-                total_download_duration = time.time() - download_start_time
-                logger.info(f"✅ SUCCESS: PDF downloaded and saved in {total_download_duration:.2f} seconds")
-                logger.info(f"📊 Total size: {downloaded_bytes:,} bytes")
-            except requests.exceptions.RequestException as e:
-                logger.error(f"❌ FAILURE: PDF download failed: {e}")
-                return False
-            except Exception as e:
-                logger.error(f"❌ FAILURE: Unexpected error during PDF download: {e}")
-                return False
-        else:
-            logger.warning(f"⚠️ WARNING: No PDF content or URL found for file: {client_filename}. Cannot proceed.")
-            return False
+def save_pdf_artifact(context: dict, pdf_data, source: str) -> None:
+    """
+    Writes the artifact copy of the PDF (<upload_id>_<timestamp>_from_<source>.pdf) on the
+    background artifact writer, so OCR does not wait for it; skipped when SAVE_PDF_ARTIFACT is off.
+    """
+    if not settings.SAVE_PDF_ARTIFACT:
+        return
+    pdf_filename = f"{context['upload_id']}_{context['timestamp']}_from_{source}.pdf"
+    pdf_path = os.path.join(context["message_folder"], pdf_filename)
 
-        # 🔍 OCR PROCESSING
+    def write_artifact():
         try:
-            logger.info("🔍 PROCESSING: Starting OCR extraction")
-            if pdf_path and os.path.exists(pdf_path):
-                logger.info(f"📄 PROCESSING: Running OCR on file: {pdf_path}")
-                ocr_start_time = time.time()
-                pdf_pages_text = get_text_from_pdf(pdf_path)
-                ocr_duration = time.time() - ocr_start_time
-                
-                if pdf_pages_text:
-                    logger.info(f"✅ SUCCESS: OCR completed in {ocr_duration:.2f} seconds")
-                    logger.info(f"📊 OCR results: {len(pdf_pages_text)} pages extracted")
-                    # Log OCR statistics
-                    total_chars = sum(len(page) for page in pdf_pages_text)
-                    total_words = sum(len(page.split()) for page in pdf_pages_text)
-                    logger.info(f"📊 Total characters extracted: {total_chars:,}")
-                    logger.info(f"📊 Total words extracted: {total_words:,}")
-                    # 💾 Save OCR text pages locally in the message folder
-                    logger.info(f"💾 PROCESSING: Saving {len(pdf_pages_text)} OCR text pages to message folder {message_folder}")
-                    try:
-                        for i, page_text in enumerate(pdf_pages_text):
-                            page_num = i + 1
-                            text_filename = f"{upload_id}_{timestamp}_page_{page_num}.txt"
-                            text_path = os.path.join(message_folder, text_filename)
-                            with open(text_path, 'w', encoding='utf-8') as f:
-                                f.write(page_text)
-                        logger.info(f"✅ SUCCESS: All OCR text pages saved to {message_folder}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ WARNING: Could not save OCR text pages: {e}")
-
-                else:
-                    logger.error("❌ FAILURE: OCR process returned empty results")
-                    return False
-            else:
-                logger.error(f"❌ FAILURE: PDF path '{pdf_path}' not found or not created. Cannot start OCR.")
-                return False
-            
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_data)
+            logger.info(f"✅ SUCCESS: PDF artifact saved to {pdf_path}")
         except Exception as e:
-            logger.error(f"❌ FAILURE: OCR processing failed: {e}", exc_info=True)
-            return False
+            logger.warning(f"⚠️ WARNING: Could not save PDF artifact {pdf_path}: {e}")
+
+    logger.info(f"💾 PROCESSING: Saving PDF to local artifacts in the background: {pdf_path}")
+    artifact_writer().submit(write_artifact)
+
+
+def load_embedded_pdf(context: dict, envelope: MessageEnvelope) -> Optional[bytes]:
+    """Stage 2a: decodes the embedded base64 PdfContent; returns the PDF bytes or None."""
+    logger.info("✅ SUCCESS: PDF content found in message (embedded base64)")
+    try:
+        # Saving the payload first releases the decoded message body before the PDF is decoded
+        save_payload(context, envelope)
+        logger.info("🔄 PROCESSING: Decoding base64 PDF content")
+        pdf_data = envelope.pdf_bytes()
+        logger.info(f"✅ SUCCESS: PDF content decoded in {envelope.pdf_decode_seconds * 1000:.1f} ms, size: {len(pdf_data)} bytes")
+        save_pdf_artifact(context, pdf_data, "message")
+        return pdf_data
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Failed to decode PDF content: {e}")
+        return None
+
+
+def download_pdf(context: dict, envelope: MessageEnvelope) -> Optional[bytearray]:
+    """Stage 2b: downloads the PDF at FilePath into memory; returns the PDF bytes or None."""
+    pdf_url = envelope.fields["FilePath"]
+    logger.info("✅ SUCCESS: PDF URL found in message (FilePath)")
+    logger.info(f"🔗 PDF URL: {pdf_url}")
+    try:
+        logger.info("🌐 PROCESSING: Starting PDF download from URL")
+        save_payload(context, envelope)
+        # Pooled keep-alive session with retries on 429/5xx (download_client)
+        pdf_data, stats = download_to_buffer(pdf_url)
+        logger.info(f"✅ SUCCESS: PDF downloaded in {stats['seconds']:.2f} seconds (time to first byte: {stats['ttfb_seconds']:.2f} seconds)")
+        logger.info(f"📊 Total size: {stats['bytes']:,} bytes ({stats['mode']}, {stats['parts']} parts, {stats['resumes']} resumes)")
+        save_pdf_artifact(context, pdf_data, "url")
+        return pdf_data
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ FAILURE: PDF download failed: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Unexpected error during PDF download: {e}")
+        return None
+
 
-        # 📋 DOCUMENT DEMARCATION PROCESSING
-        logger.info("📋 PROCESSING: Starting document demarcation")
-        identifiers = message_content.get("Identifiers", [])
+def download_blob_pdf(context: dict, envelope: MessageEnvelope) -> Optional[bytes]:
+    """Stage 2c: reads the claim-check PDF (BlobName/BlobContainer) from Blob Storage; returns the PDF bytes or None."""
+    container, blob_name = blob_reference(envelope.fields)
+    logger.info("✅ SUCCESS: PDF blob reference found in message (BlobName)")
+    logger.info(f"🔗 PDF blob: {container}/{blob_name}")
+    try:
+        logger.info("🌐 PROCESSING: Starting PDF download from Blob Storage")
+        save_payload(context, envelope)
+        pdf_data, stats = download_blob_to_buffer(container, blob_name)
+        logger.info(f"✅ SUCCESS: PDF blob downloaded in {stats['seconds']:.2f} seconds (time to first block: {stats['ttfb_seconds']:.2f} seconds)")
+        logger.info(f"📊 Total size: {stats['bytes']:,} bytes ({stats['mode']}, {stats['parts']} parts)")
+        save_pdf_artifact(context, pdf_data, "blob")
+        return pdf_data
+    except AzureError as e:
+        logger.error(f"❌ FAILURE: PDF blob download failed for {container}/{blob_name}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Unexpected error during PDF blob download: {e}")
+        return None
+
+
+def ocr_and_demarcate(context: dict, pdf_data: bytes, message_content: dict) -> Optional[dict]:
+    """
+    Stage 3 (CPU-bound): OCRs the PDF, demarcates the sub-documents and builds the
+    classification message, saving page texts and the outgoing message as artifacts.
+    Returns the classification message, or None on failure.
+    """
+    upload_id = context["upload_id"]
+    timestamp = context["timestamp"]
+    message_folder = context["message_folder"]
 
-        if not identifiers:
-            logger.warning("⚠️ WARNING: No identifiers found in message")
+    # 🔍 OCR PROCESSING
+    try:
+        logger.info("🔍 PROCESSING: Starting OCR extraction")
+        if pdf_data:
+            logger.info(f"📄 PROCESSING: Running OCR on in-memory PDF ({len(pdf_data):,} bytes)")
+            ocr_start_time = time.time()
+            pdf_pages = extract_pages_from_pdf(pdf_data)
+            pdf_pages_text = [page["text"] for page in pdf_pages]
+            ocr_duration = time.time() - ocr_start_time
+
+            if pdf_pages_text:
+                logger.info(f"✅ SUCCESS: OCR completed in {ocr_duration:.2f} seconds")
+                logger.info(f"📊 OCR results: {len(pdf_pages_text)} pages extracted")
+                # Log OCR statistics
+                total_chars = sum(len(page) for page in pdf_pages_text)
+                total_words = sum(len(page.split()) for page in pdf_pages_text)
+                logger.info(f"📊 Total characters extracted: {total_chars:,}")
+                logger.info(f"📊 Total words extracted: {total_words:,}")
+                # 💾 Save OCR text pages locally in the message folder
+                logger.info(f"💾 PROCESSING: Saving {len(pdf_pages_text)} OCR text pages to message folder {message_folder}")
+                try:
+                    for i, page_text in enumerate(pdf_pages_text):
+                        page_num = i + 1
+                        text_filename = f"{upload_id}_{timestamp}_page_{page_num}.txt"
+                        text_path = os.path.join(message_folder, text_filename)
+                        with open(text_path, 'w', encoding='utf-8') as f:
+                            f.write(page_text)
+                    logger.info(f"✅ SUCCESS: All OCR text pages saved to {message_folder}")
+                except Exception as e:
+                    logger.warning(f"⚠️ WARNING: Could not save OCR text pages: {e}")
+                # 💾 Save per-page provenance (text layer vs OCR) next to the page texts
+                try:
+                    provenance = [
+                        {
+                            "page": page["page"],
+                            "source": page["source"],
+                            "chars": len(page["text"]),
+                            "dpi": page.get("dpi"),
+                            "confidence": page.get("confidence"),
+                            "escalated": page.get("escalated", False),
+                            "blank": page.get("blank", False),
+                            "failed": page.get("failed", False),
+                        }
+                        for page in pdf_pages
+                    ]
+                    provenance_path = os.path.join(message_folder, f"{upload_id}_{timestamp}_pages.json")
+                    with open(provenance_path, 'w', encoding='utf-8') as f:
+                        json.dump(provenance, f, ensure_ascii=False, indent=2)
+                    logger.info(f"✅ SUCCESS: Page provenance saved to {provenance_path}")
+                except Exception as e:
+                    logger.warning(f"⚠️ WARNING: Could not save page provenance: {e}")
+
+            else:
+                logger.error("❌ FAILURE: OCR process returned empty results")
+                return None
         else:
-            logger.info(f"✅ SUCCESS: Found {len(identifiers)} identifiers for processing")
-
-        # Enrich identifiers with message metadata
-        for ident in identifiers:
-            ident["DocReceivedId"] = message_content.get("DocReceivedId")
-            ident["FirmFile"] = message_content.get("FirmFile")
-            ident["UploadDatasheetid"] = message_content.get("UploadDatasheetid")
-            ident["SessionId"] = message_content.get("SessionId")
-
-        # Log all input to demarcate_document for traceability
-        if pdf_pages_text:
-            for i, page in enumerate(pdf_pages_text):
-                logger.info(f"🔎 DEMARCATION INPUT: Page {i+1}: {page[:1000]}")
+            logger.error("❌ FAILURE: PDF content is empty. Cannot start OCR.")
+            return None
+
+    except Exception as e:
+        logger.error(f"❌ FAILURE: OCR processing failed: {e}", exc_info=True)
+        return None
+
+    # 📋 DOCUMENT DEMARCATION PROCESSING
+    logger.info("📋 PROCESSING: Starting document demarcation")
+    identifiers = message_content.get("Identifiers", [])
+
+    if not identifiers:
+        logger.warning("⚠️ WARNING: No identifiers found in message")
+    else:
+        logger.info(f"✅ SUCCESS: Found {len(identifiers)} identifiers for processing")
+
+    # Enrich identifiers with message metadata
+    for ident in identifiers:
+        ident["DocReceivedId"] = message_content.get("DocReceivedId")
+        ident["FirmFile"] = message_content.get("FirmFile")
+        ident["UploadDatasheetid"] = message_content.get("UploadDatasheetid")
+        ident["SessionId"] = message_content.get("SessionId")
+
+    # Log all input to demarcate_document for traceability
+    if pdf_pages_text:
+        for i, page in enumerate(pdf_pages_text):
+            logger.info(f"🔎 DEMARCATION INPUT: Page {i+1}: {page[:1000]}")
+    else:
+        logger.info("🔎 DEMARCATION INPUT: NO OCR TEXT")
+    logger.info(f"🔎 DEMARCATION INPUT: All Identifiers: {json.dumps(identifiers, ensure_ascii=False)}")
+
+    try:
+        sub_document_rows = demarcate_document(pdf_pages_text, identifiers)
+        logger.info(f"🔎 DEMARCATION OUTPUT: {json.dumps(sub_document_rows, ensure_ascii=False)}")
+        if sub_document_rows:
+            logger.info(f"✅ SUCCESS: Document demarcation completed. {len(sub_document_rows)} documents found.")
         else:
-            logger.info("🔎 DEMARCATION INPUT: NO OCR TEXT")
-        logger.info(f"🔎 DEMARCATION INPUT: All Identifiers: {json.dumps(identifiers, ensure_ascii=False)}")
+            logger.error("❌ FAILURE: Document demarcation returned no results")
+            return None
 
-        try:
-            sub_document_rows = demarcate_document(pdf_pages_text, identifiers)
-            logger.info(f"🔎 DEMARCATION OUTPUT: {json.dumps(sub_document_rows, ensure_ascii=False)}")
-            if sub_document_rows:
-                logger.info(f"✅ SUCCESS: Document demarcation completed. {len(sub_document_rows)} documents found.")
-            else:
-                logger.error("❌ FAILURE: Document demarcation returned no results")
-                return False
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Document demarcation failed: {e}", exc_info=True)
+        return None
 
-        except Exception as e:
-            logger.error(f"❌ FAILURE: Document demarcation failed: {e}", exc_info=True)
+    # 📋 XML PAYLOAD CREATION
+    logger.info("📋 PROCESSING: Creating XML payload for API submission")
+    try:
+        xml_payload = create_subdocument_xml(sub_document_rows)
+        if not xml_payload:
+            logger.error("❌ FAILURE: XML payload creation returned empty result")
+            return None
+        logger.info(f"✅ SUCCESS: XML payload created. Length: {len(xml_payload)} chars")
+
+    except Exception as e:
+        logger.error(f"❌ FAILURE: XML payload creation failed: {e}", exc_info=True)
+        return None
+
+    # 🌐 API SUBMISSION PROCESSING
+    # NOTE: API integration removed per configuration - we skip API submission
+    logger.info("🌐 PROCESSING: API submission is skipped (API integration removed). Marking as skipped.")
+    api_status = "skipped"
+
+    # 📤 QUEUE MESSAGE PROCESSING
+    logger.info("📤 PROCESSING: Preparing classification message for output queue")
+
+    try:
+        # Send the full demarcation details instead of just IDs
+        classification_message = {
+            "SubDocumentDetails": {
+                "SubDocumentRow": sub_document_rows
+            },
+            "ApiStatus": api_status
+        }
+
+        # Save the sent message in the same message-specific folder
+        sent_json_path = os.path.join(message_folder, f"sent_{settings.CLASSIFICATION_QUEUE_NAME}_{timestamp}.json")
+        with open(sent_json_path, 'w', encoding='utf-8') as f:
+            json.dump(classification_message, f, ensure_ascii=False, indent=2)
+
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Queue message processing failed: {e}", exc_info=True)
+        return None
+
+    return classification_message
+
+
+def log_message_completed(context: dict) -> None:
+    """Final success summary for a processed message."""
+    total_duration = time.time() - context["process_start_time"]
+    logger.info("🎉 SUCCESS: Message processing completed successfully!")
+    logger.info(f"⏰ Total processing time: {total_duration:.2f} seconds")
+    logger.info(f"📋 UploadDatasheetid: {context['upload_id']}")
+
+
+def log_message_crashed(message_content: dict, process_start_time: float, error: Exception) -> None:
+    total_duration = time.time() - process_start_time
+    logger.error("💥 CRITICAL FAILURE: Unhandled exception in message processing")
+    logger.error(f"❌ Error: {str(error)}")
+    logger.error(f"📋 UploadDatasheetid: {message_content.get('UploadDatasheetid', 'UNKNOWN')}")
+    logger.error(f"⏰ Failed after: {total_duration:.2f} seconds")
+    logger.error("📋 Stack trace:", exc_info=True)
+
+
+def process_message(envelope: MessageEnvelope, input_queue_service: AzureQueueService, output_queue_service: AzureQueueService) -> bool:
+    """Process a single queue message for OCR"""
+
+    message_content = envelope.fields
+    process_start_time = time.time()
+    try:
+        context = start_message(message_content)
+        if context is None:
             return False
 
-        # 📋 XML PAYLOAD CREATION
-        logger.info("📋 PROCESSING: Creating XML payload for API submission")
-        try:
-            xml_payload = create_subdocument_xml(sub_document_rows)
-            if not xml_payload:
-                logger.error("❌ FAILURE: XML payload creation returned empty result")
-                return False
-            logger.info(f"✅ SUCCESS: XML payload created. Length: {len(xml_payload)} chars")
-                
-        except Exception as e:
-            logger.error(f"❌ FAILURE: XML payload creation failed: {e}", exc_info=True)
+        # 📄 PDF CONTENT PROCESSING
+        logger.info("📄 PROCESSING: Checking for PDF content in message")
+        if envelope.has_embedded_pdf:
+            pdf_data = load_embedded_pdf(context, envelope)
+        elif blob_reference(message_content):
+            pdf_data = download_blob_pdf(context, envelope)
+        elif message_content.get("FilePath"):
+            pdf_data = download_pdf(context, envelope)
+        else:
+            logger.warning(f"⚠️ WARNING: No PDF content or URL found for file: {context['client_filename']}. Cannot proceed.")
+            return False
+        if not pdf_data:
             return False
-        
-        # 🌐 API SUBMISSION PROCESSING
-        # NOTE: API integration removed per configuration - we skip API submission
-        logger.info("🌐 PROCESSING: API submission is skipped (API integration removed). Marking as skipped.")
-        is_api_success = True
-        api_status = "skipped"
 
-        # 📤 QUEUE MESSAGE PROCESSING
-        logger.info("📤 PROCESSING: Preparing classification message for output queue")
+        classification_message = ocr_and_demarcate(context, pdf_data, message_content)
+        if classification_message is None:
+            return False
 
         try:
-            # Send the full demarcation details instead of just IDs
-            classification_message = {
-                "SubDocumentDetails": {
-                    "SubDocumentRow": sub_document_rows
-                },
-                "ApiStatus": api_status if 'api_status' in locals() else "skipped"
-            }
-
-            # Save the sent message in the same message-specific folder
-            sent_json_path = os.path.join(message_folder, f"sent_{settings.CLASSIFICATION_QUEUE_NAME}_{timestamp}.json")
-            with open(sent_json_path, 'w', encoding='utf-8') as f:
-                json.dump(classification_message, f, ensure_ascii=False, indent=2)
-
             logger.info(f"📡 PROCESSING: Sending SubDocumentDetails to classification queue: {settings.CLASSIFICATION_QUEUE_NAME}")
             logger.info(f"📤 OUTPUT QUEUE MESSAGE: {json.dumps(classification_message, ensure_ascii=False)[:1000]}")
             output_queue_service.send_message(
@@ -305,22 +449,138 @@ def process_message(message_content: dict, input_queue_service: AzureQueueServic
             return False
 
         # 📊 FINAL SUCCESS SUMMARY
-        total_duration = time.time() - process_start_time
-        logger.info("🎉 SUCCESS: Message processing completed successfully!")
-        logger.info(f"⏰ Total processing time: {total_duration:.2f} seconds")
-        logger.info(f"📋 UploadDatasheetid: {upload_id}")
-
+        log_message_completed(context)
         return True
 
     except Exception as e:
-        total_duration = time.time() - process_start_time
-        logger.error("💥 CRITICAL FAILURE: Unhandled exception in message processing")
-        logger.error(f"❌ Error: {str(e)}")
-        logger.error(f"📋 UploadDatasheetid: {upload_id}")
-        logger.error(f"⏰ Failed after: {total_duration:.2f} seconds")
-        logger.error("📋 Stack trace:", exc_info=True)
+        log_message_crashed(message_content, process_start_time, e)
         return False
 
+
+class MessageMetrics:
+    """Thread-safe message counters plus a rolling window of per-message latencies."""
+
+    def __init__(self, window: int = 200):
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=window)
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, success: bool, seconds: float) -> None:
+        with self._lock:
+            self.processed += 1
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self._latencies.append(seconds)
+
+    def summary(self) -> str:
+        """Totals, throughput since start, and p50/p95 latency over the recent window."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            processed, succeeded, failed = self.processed, self.succeeded, self.failed
+        elapsed_minutes = max(time.time() - self._started_at, 1e-9) / 60
+        line = (f"{processed} processed ({succeeded} succeeded, {failed} failed), "
+                f"{processed / elapsed_minutes:.2f} messages/min")
+        if latencies:
+            p50 = latencies[max(0, math.ceil(0.50 * len(latencies)) - 1)]
+            p95 = latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)]
+            line += f", latency p50 {p50:.2f}s / p95 {p95:.2f}s over last {len(latencies)}"
+        return line
+
+
+class AdaptivePoller:
+    """
+    Decides when to poll the input queue next: immediately while polls keep returning
+    messages, then exponential backoff with jitter from POLL_MIN_INTERVAL up to
+    POLL_MAX_INTERVAL while the queue stays empty. Empty polls still cost a storage
+    transaction each, so the interval and empty-poll rate are logged for tuning.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, multiplier: float, jitter: float):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.interval = 0.0
+        self.next_poll_at = 0.0
+        self.polls = 0
+        self.empty_polls = 0
+
+    def seconds_until_poll(self) -> float:
+        return max(0.0, self.next_poll_at - time.time())
+
+    def record(self, received: int) -> float:
+        """Records a poll's outcome and returns the delay before the next poll."""
+        self.polls += 1
+        if received:
+            self.interval = 0.0
+        else:
+            self.empty_polls += 1
+            self.interval = min(self.max_interval, max(self.min_interval, self.interval * self.multiplier))
+        delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.next_poll_at = time.time() + delay
+        return delay
+
+    def summary(self) -> str:
+        empty_rate = self.empty_polls / self.polls if self.polls else 0.0
+        return f"poll interval {self.interval:.1f}s, {self.empty_polls}/{self.polls} empty polls ({empty_rate:.0%})"
+
+
+def message_envelope(message) -> MessageEnvelope:
+    """
+    The envelope decoded when the message was received (AzureQueueService.receive_messages);
+    decodes here only for messages that failed to decode then (raises json.JSONDecodeError).
+    """
+    logger.info(f"📝 RAW MESSAGE CONTENT (first 500 chars): {message.content[:500]}")
+    envelope = getattr(message, "envelope", None) or MessageEnvelope.decode(message.content)
+    logger.info(f"✅ SUCCESS: Message decoded ({envelope.encoding}) in {envelope.decode_seconds * 1000:.1f} ms")
+    return envelope
+
+
+def handle_queue_message(message, input_queue_service: AzureQueueService, output_queue_service: AzureQueueService, metrics: MessageMetrics, lease: Optional[LeaseHeartbeat] = None) -> None:
+    """
+    Decodes and processes one leased message on a message worker; deletes it only on success.
+    lease is the heartbeat of a prefetched message that is already being kept alive.
+    """
+    start_time = time.time()
+    success = False
+    input_queue_service.mark_started()
+    logger.info(f"🔄 PROCESSING: Message ID: {message.id}")
+    # Keep the message invisible for as long as OCR runs; deletes must use the latest pop receipt
+    lease = lease or input_queue_service.keep_alive(message)
+
+    try:
+        with lease:
+            envelope = message_envelope(message)
+            success = process_message(envelope, input_queue_service, output_queue_service)
+        input_queue_service.lease_estimator.record(time.time() - start_time)
+        logger.info(f"📊 DECODE: {envelope.decode_stats()}")
+
+        if success:
+            if lease.lost:
+                logger.warning(f"⚠️ WARNING: Lease on message {message.id} was lost during processing; another replica may have picked it up.")
+            logger.info(f"🗑️ PROCESSING: Deleting successfully processed message: {message.id}")
+            input_queue_service.delete_message(message.id, lease.pop_receipt)
+            logger.info(f"✅ SUCCESS: Message {message.id} processed and deleted from input queue.")
+        else:
+            logger.error(f"❌ FAILURE: Failed to process message {message.id}. It will be reprocessed later.")
+
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ FAILURE: Invalid JSON in message {message.id}: {e}. Deleting message.")
+        input_queue_service.delete_message(message.id, lease.pop_receipt)
+
+    except Exception as e:
+        logger.error(f"❌ FAILURE: Unhandled error processing message {message.id}: {e}", exc_info=True)
+
+    metrics.record(success, time.time() - start_time)
+    logger.info(f"📊 MESSAGES: {metrics.summary()}")
+    logger.info(f"📊 LEASES: {input_queue_service.lease_stats()}")
+
+
 def main():
     """Main queue processing loop"""
     logger.info("🚀 STARTING OCR PROCESSOR APPLICATION")
@@ -334,6 +594,7 @@ def main():
     logger.info(f"📋 CLASSIFICATION_QUEUE_NAME: {settings.CLASSIFICATION_QUEUE_NAME}")
     logger.info(f"📋 ARTIFACTS_DIR: {settings.ARTIFACTS_DIR}")
     logger.info(f"📋 SKIP_API_CALL: {settings.SKIP_API_CALL}")
+    logger.info(f"📋 MAX_CONCURRENT_MESSAGES: {settings.MAX_CONCURRENT_MESSAGES}")
     
     if not settings.AZURE_STORAGE_CONNECTION_STRING or not settings.INPUT_QUEUE_NAME or not settings.CLASSIFICATION_QUEUE_NAME:
         logger.error("❌ CRITICAL FAILURE: Missing Azure Storage or Queue Name configuration.")
@@ -356,70 +617,82 @@ def main():
     
     logger.info("✅ SUCCESS: All services initialized successfully. Starting main loop.")
     
-    total_messages_processed = 0
-    total_messages_succeeded = 0
-    total_messages_failed = 0
-    
-    while not shutdown_event.is_set():
-        try:
-            logger.info("🔄 POLLING: Checking for new messages in input queue...")
-            messages = input_queue_service.receive_messages(max_messages=5)
-            
-            if messages:
-                logger.info(f"✅ SUCCESS: Retrieved {len(messages)} messages.")
-                total_messages_processed += len(messages)
-                
-                for message in messages:
-                    logger.info(f"🔄 PROCESSING: Message ID: {message.id}")
-                    
-                    try:
-                        content = message.content
-                        logger.info(f"📝 RAW MESSAGE CONTENT (first 500 chars): {content[:500]}")
-                        try:
-                            # Try to decode base64 first
-                            decoded_content = base64.b64decode(content).decode('utf-8')
-                            message_data = json.loads(decoded_content)
-                            logger.info("✅ SUCCESS: Message decoded as base64 JSON")
-                        except:
-                            # If base64 fails, try direct JSON
-                            message_data = json.loads(content)
-                            logger.info("✅ SUCCESS: Message parsed as direct JSON")
-                        
-                        success = process_message(message_data, input_queue_service, output_queue_service)
-                        
-                        if success:
-                            logger.info(f"🗑️ PROCESSING: Deleting successfully processed message: {message.id}")
-                            input_queue_service.delete_message(message.id, message.pop_receipt)
-                            logger.info(f"✅ SUCCESS: Message {message.id} processed and deleted from input queue.")
-                            total_messages_succeeded += 1
+    max_concurrent = max(1, settings.MAX_CONCURRENT_MESSAGES)
+    metrics = MessageMetrics()
+    poller = AdaptivePoller(settings.POLL_MIN_INTERVAL, settings.POLL_MAX_INTERVAL, settings.POLL_BACKOFF_MULTIPLIER, settings.POLL_JITTER)
+    in_flight = {}  # future -> leased message
+    prefetched = deque()  # (message, lease) leased ahead of a free slot and kept alive by its heartbeat
+
+    def submit(message, lease=None):
+        future = message_pool.submit(handle_queue_message, message, input_queue_service, output_queue_service, metrics, lease)
+        in_flight[future] = message
+
+    with ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="message") as message_pool:
+        while not shutdown_event.is_set():
+            try:
+                in_flight = {future: message for future, message in in_flight.items() if not future.done()}
+                # Prefetched messages take free slots first
+                while prefetched and len(in_flight) < max_concurrent:
+                    submit(*prefetched.popleft())
+
+                free_slots = max_concurrent - len(in_flight)
+                # Lease the free slots plus a small prefetch, so the next batch is ready when a document finishes
+                wanted = free_slots + max(0, settings.POLL_PREFETCH_MESSAGES - len(prefetched))
+                wait_seconds = poller.seconds_until_poll() if wanted > 0 else 1
+                if wait_seconds > 0:
+                    # Wake up when a document finishes, the poll is due, or shutdown is requested
+                    if in_flight:
+                        wait(in_flight, timeout=min(wait_seconds, 1), return_when=FIRST_COMPLETED)
+                    else:
+                        shutdown_event.wait(min(wait_seconds, 1))
+                    continue
+
+                logger.info(f"🔄 POLLING: Checking for new messages in input queue ({free_slots} free slots, {len(prefetched)} prefetched)...")
+                messages = input_queue_service.receive_messages(max_messages=min(wanted, MAX_MESSAGES_PER_RECEIVE))
+                delay = poller.record(len(messages))
+
+                if messages:
+                    logger.info(f"✅ SUCCESS: Retrieved {len(messages)} messages.")
+                    for message in messages:
+                        if len(in_flight) < max_concurrent:
+                            submit(message)
                         else:
-                            logger.error(f"❌ FAILURE: Failed to process message {message.id}. It will be reprocessed later.")
-                            total_messages_failed += 1
-                            
-                    except json.JSONDecodeError as e:
-                        logger.error(f"❌ FAILURE: Invalid JSON in message {message.id}: {e}. Deleting message.")
-                        input_queue_service.delete_message(message.id, message.pop_receipt)
-                        total_messages_failed += 1
-                        
-                    except Exception as e:
-                        logger.error(f"❌ FAILURE: Unhandled error processing message {message.id}: {e}", exc_info=True)
-                        total_messages_failed += 1
-            else:
-                logger.info("ℹ️ INFO: No messages in queue. Waiting for 30 seconds.")
+                            lease = input_queue_service.keep_alive(message)
+                            lease.start()
+                            prefetched.append((message, lease))
+                else:
+                    logger.info(f"ℹ️ INFO: No messages in queue. Next poll in {delay:.1f} seconds ({poller.summary()}).")
+
+            except Exception as e:
+                logger.error(f"💥 CRITICAL FAILURE: Error in main loop: {e}", exc_info=True)
+                logger.info("😴 WAITING: 30 seconds before retrying.")
                 if shutdown_event.wait(30):
                     break
-            
-        except Exception as e:
-            logger.error(f"💥 CRITICAL FAILURE: Error in main loop: {e}", exc_info=True)
-            logger.info("😴 WAITING: 30 seconds before retrying.")
-            if shutdown_event.wait(30):
-                break
 
+        # Messages leased but not yet picked up by a worker go straight back to the queue
+        while prefetched:
+            message, lease = prefetched.popleft()
+            lease.stop()
+            input_queue_service.release_message(message, lease.pop_receipt)
+        for future, message in in_flight.items():
+            if future.cancel():
+                input_queue_service.release_message(message)
+        in_flight = {future: message for future, message in in_flight.items() if not future.done()}
+        if in_flight:
+            # Leaving the with-block joins the pool: in-flight documents finish and are deleted on success
+            logger.info(f"🛑 SHUTDOWN: Waiting for {len(in_flight)} in-flight messages to finish")
+
+    logger.info(f"📊 FINAL: {metrics.summary()}")
+    logger.info(f"📊 FINAL: {input_queue_service.lease_stats()}")
+    logger.info(f"📊 FINAL: {poller.summary()}")
 
 if __name__ == "__main__":
+    setup_logging()
+    install_signal_handlers()
     try:
         main()
     except KeyboardInterrupt:
         logger.info("🔔 KeyboardInterrupt received - shutting down")
     finally:
+        shutdown_page_pools()
         logger.info("🛑 OCR processor exiting")
\ No newline at end of file
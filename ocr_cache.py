@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_of_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_of_bytes(data) -> str:
+    """Returns the hex SHA-256 of an in-memory PDF (bytes, bytearray or memoryview)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class OcrResultCache:
+    """
+    Content-addressed on-disk cache of per-page OCR results.
+
+    Entries are keyed by the SHA-256 of the PDF bytes plus every setting that changes
+    the extracted text (DPI, language, engine, ...), so a re-delivered message or a
+    re-uploaded file under a new UploadDatasheetid is served without re-OCRing.
+    Each entry is one JSON file; its mtime is the LRU clock and the directory is
+    trimmed to max_bytes, oldest first, after every write.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(pdf_sha256: str, params: Dict[str, Any]) -> str:
+        """Builds the cache key from the PDF hash and the OCR parameters."""
+        material = json.dumps({"pdf": pdf_sha256, **params}, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """Returns the cached pages for key, or None on a miss."""
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    pages = json.load(f)
+                os.utime(path)  # Touch: most recently used
+                self.hits += 1
+                return pages
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except Exception as e:
+                logger.warning(f"⚠️ WARNING: Discarding unreadable OCR cache entry {path}: {e}")
+                self.misses += 1
+                self._remove(path)
+                return None
+
+    def put(self, key: str, pages: List[Dict]) -> None:
+        """Stores pages under key, then evicts least recently used entries beyond max_bytes."""
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(pages, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                self._evict(keep=path)
+            except Exception as e:
+                logger.warning(f"⚠️ WARNING: Could not write OCR cache entry {path}: {e}")
+
+    def _evict(self, keep: str) -> None:
+        """Removes least recently used entries until the cache fits max_bytes; never removes keep."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if entry_path == keep:
+                continue
+            self._remove(entry_path)
+            total_bytes -= size
+            self.evictions += 1
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and the hit rate so far."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+ocr_result_cache = OcrResultCache(settings.OCR_CACHE_DIR, settings.OCR_CACHE_MAX_BYTES)
+
+
+class PageResultCache:
+    """
+    Bounded in-memory LRU of per-page results keyed by page fingerprint.
+    Shared across documents, so repeated cover sheets, fax headers and boilerplate
+    notices are OCRed once per process rather than once per occurrence.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Returns a copy of the cached page result, or None on a miss."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key: str, result: Dict) -> None:
+        """Stores a page result, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+page_result_cache = PageResultCache(settings.PAGE_CACHE_MAX_ENTRIES)
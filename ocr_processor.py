@@ -216,63 +216,918 @@
 
 
 import fitz  # PyMuPDF
+import numpy as np
 import pytesseract
+import bisect
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
+import os
 import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
 from PIL import Image
-from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, List, Dict, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, List, Dict, Tuple, Union
+from config import settings
+from ocr_cache import OcrResultCache, ocr_result_cache, page_result_cache, sha256_of_bytes, sha256_of_file
+
+try:
+    import resource  # POSIX only; peak RSS reporting is skipped where it is unavailable
+except ImportError:
+    resource = None
+
+try:
+    import ahocorasick  # pyahocorasick: all demarcation identifiers matched in one pass per page
+except ImportError:
+    ahocorasick = None
 
 # Use the application's logging configuration
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+
+# ---------------- OCR PART ----------------
+# Executor modes accepted by get_text_from_pdf / Settings.OCR_EXECUTOR
+OCR_EXECUTOR_PROCESS = "process"
+OCR_EXECUTOR_THREAD = "thread"
+# Per-page provenance recorded in extract_pages_from_pdf results
+PAGE_SOURCE_TEXT_LAYER = "text_layer"
+PAGE_SOURCE_OCR = "ocr"
+PAGE_SOURCE_BLANK = "blank"
+
+# Per-worker state. Page pools live as long as the process, so every worker (process or thread)
+# creates its OCR engine once in its initializer, and opens each document on its first page
+# of it, reusing that handle for the rest of the document's pages.
+_worker_state = threading.local()
+# MuPDF is not thread-safe, so every fitz call in a process holds this lock: opening documents,
+# fingerprinting and rendering, from message threads and pool threads alike.
+# Tesseract itself runs outside the lock, which is where thread mode gets its parallelism.
+_render_lock = threading.Lock()
+# Page pools are started from a multithreaded parent (message workers, heartbeats, the asyncio
+# executors), where a forked child could inherit MuPDF, logging or urllib3 locks held by another
+# thread. Workers come from a forkserver (spawn where that is unavailable), and the pools are
+# reused across documents (see _get_page_pool), so workers start once per process, not per document.
+# Every worker still runs the entry script as __mp_main__. The forkserver preloads the script
+# as a plain module ("main" for main.py) and this one, so that re-run finds its imports (the Azure
+# SDKs, MuPDF) already loaded. Entry scripts must therefore keep their side effects under
+# `if __name__ == "__main__"`.
+_entry_script = getattr(sys.modules["__main__"], "__file__", None)
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _page_pool_context = multiprocessing.get_context("forkserver")
+    _page_pool_context.set_forkserver_preload(
+        ([os.path.splitext(os.path.basename(_entry_script))[0]] if _entry_script else []) + [__name__])
+else:
+    _page_pool_context = multiprocessing.get_context("spawn")
+# Long-lived page pools by (mode, workers, engine, language, fast tessdata dir)
+_page_pools: Dict[Tuple, Executor] = {}
+_page_pools_lock = threading.Lock()
+
+# A PDF can be given as a file path or as its bytes (bytes, bytearray, memoryview or a binary buffer)
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, io.BufferedIOBase, io.BytesIO]
+
+
+def _normalize_pdf_source(pdf_source: PdfSource) -> Union[str, bytes, bytearray, memoryview]:
+    """Returns a path or a bytes-like object; buffers are read once so every worker can open them."""
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return os.fspath(pdf_source)
+    if isinstance(pdf_source, io.BytesIO):
+        return pdf_source.getbuffer()
+    if hasattr(pdf_source, 'read'):
+        return pdf_source.read()
+    return pdf_source
+
+
+def _open_pdf(pdf_source: Union[str, bytes, bytearray, memoryview]) -> fitz.Document:
+    """Opens a PDF from a path, or directly from memory without touching the disk."""
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source)
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+
+def _describe_pdf_source(pdf_source) -> str:
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return f"'{os.fspath(pdf_source)}'"
+    return f"<in-memory PDF, {len(pdf_source):,} bytes>" if hasattr(pdf_source, '__len__') else "<in-memory PDF>"
+
+
+def _text_and_confidence_from_data(data: Dict[str, list]) -> Tuple[str, float]:
+    """
+    Rebuilds page text and the mean word confidence from Tesseract's TSV (image_to_data) output.
+    Words are joined per line and paragraphs are separated by a blank line; entries with
+    conf -1 are layout rows, not words. A page with no recognized words scores 0.
+    """
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+
+    text_lines = []
+    previous_paragraph = None
+    for (block_num, par_num, _), words in lines.items():
+        if previous_paragraph is not None and (block_num, par_num) != previous_paragraph:
+            text_lines.append("")
+        text_lines.append(" ".join(words))
+        previous_paragraph = (block_num, par_num)
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n".join(text_lines), mean_confidence
+
+
+class OcrEngine:
+    """
+    Interface for page OCR backends. Each pool worker creates one engine in its
+    initializer and reuses it for every page it handles.
+    Implementations raise TimeoutError when a page exceeds its time budget.
+    fast_tessdata_dir optionally points at a faster (e.g. tessdata_fast) model set used
+    for the low-resolution pass of adaptive OCR.
+    """
+    name = ""
+
+    def __init__(self, lang: str, fast_tessdata_dir: Optional[str] = None):
+        self.lang = lang
+        self.fast_tessdata_dir = fast_tessdata_dir
+
+    @classmethod
+    def check_available(cls) -> None:
+        """Raises RuntimeError if the backend can't run here; called once before the pool starts."""
+
+    def image_to_text(self, image: Image, timeout: int = 0) -> str:
+        raise NotImplementedError
+
+    def image_to_text_with_confidence(self, image: Image, timeout: int = 0, fast: bool = False) -> Tuple[str, float]:
+        """Returns the page text and Tesseract's mean word confidence (0-100)."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Runs the tesseract CLI through pytesseract (one process spawn and model load per page)."""
+    name = "pytesseract"
+
+    @staticmethod
+    def _run(fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except RuntimeError as e:
+            # pytesseract kills the tesseract process and raises RuntimeError on timeout
+            if "timeout" in str(e).lower():
+                raise TimeoutError(str(e)) from e
+            raise
 
+    def image_to_text(self, image: Image, timeout: int = 0) -> str:
+        return self._run(pytesseract.image_to_string, image, lang=self.lang, timeout=timeout)
 
-# ---------------- OCR PART (Unchanged) ----------------
-def _ocr_page_image(image: Image) -> str:
-    """Performs OCR on a single image object."""
+    def image_to_text_with_confidence(self, image: Image, timeout: int = 0, fast: bool = False) -> Tuple[str, float]:
+        config = f'--tessdata-dir "{self.fast_tessdata_dir}"' if fast and self.fast_tessdata_dir else ""
+        data = self._run(pytesseract.image_to_data, image, lang=self.lang, config=config,
+                         output_type=pytesseract.Output.DICT, timeout=timeout)
+        return _text_and_confidence_from_data(data)
+
+
+class TesserocrEngine(OcrEngine):
+    """
+    Keeps one initialized Tesseract API handle in-process via the tesserocr bindings,
+    so the traineddata is loaded once per worker and no process is spawned per page.
+    """
+    name = "tesserocr"
+
+    def __init__(self, lang: str, fast_tessdata_dir: Optional[str] = None):
+        super().__init__(lang, fast_tessdata_dir)
+        self.check_available()
+        import tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+        self._fast_api = None
+
+    @classmethod
+    def check_available(cls) -> None:
+        try:
+            import tesserocr  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("OCR_ENGINE=tesserocr requires the 'tesserocr' package") from e
+
+    @staticmethod
+    def _recognize(api, image: Image, timeout: int) -> None:
+        api.SetImage(image)
+        # Recognize takes milliseconds (0 = no limit) and returns False when the budget runs out
+        if not api.Recognize(timeout * 1000):
+            raise TimeoutError(f"Tesseract recognition exceeded {timeout}s")
+
+    def image_to_text(self, image: Image, timeout: int = 0) -> str:
+        self._recognize(self._api, image, timeout)
+        return self._api.GetUTF8Text()
+
+    def image_to_text_with_confidence(self, image: Image, timeout: int = 0, fast: bool = False) -> Tuple[str, float]:
+        api = self._api
+        if fast and self.fast_tessdata_dir:
+            if self._fast_api is None:
+                import tesserocr
+                self._fast_api = tesserocr.PyTessBaseAPI(path=self.fast_tessdata_dir, lang=self.lang)
+            api = self._fast_api
+        self._recognize(api, image, timeout)
+        return api.GetUTF8Text(), float(api.MeanTextConf())
+
+    def close(self) -> None:
+        self._api.End()
+        if self._fast_api is not None:
+            self._fast_api.End()
+
+
+# Backends selectable through Settings.OCR_ENGINE
+OCR_ENGINES = {engine.name: engine for engine in (PytesseractEngine, TesserocrEngine)}
+
+
+def _get_ocr_engine_class(name: str) -> type:
+    """Looks up the OCR backend registered under the given name."""
+    try:
+        return OCR_ENGINES[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown OCR engine '{name}' (expected one of: {', '.join(OCR_ENGINES)})")
+
+
+def create_ocr_engine(name: str, lang: str, fast_tessdata_dir: Optional[str] = None) -> OcrEngine:
+    """Instantiates the OCR backend registered under the given name."""
+    return _get_ocr_engine_class(name)(lang, fast_tessdata_dir)
+
+
+def _call_worker_engine(call, timeout: int):
+    """Runs call(engine) with the worker's engine, logging and returning None on failure or timeout."""
+    engine = _worker_state.engine
     try:
-        return pytesseract.image_to_string(image, lang="eng")
+        return call(engine)
+    except TimeoutError as e:
+        logger.error(f"{engine.name} timed out after {timeout}s on an image: {e}")
+        return None
     except Exception as e:
-        logger.error(f"Pytesseract failed on an image: {e}")
-        return ""
+        logger.error(f"{engine.name} failed on an image: {e}")
+        return None
+
+
+def _ocr_page_image(image: Image, timeout: int = 0) -> Optional[str]:
+    """Performs OCR on a single image object with the worker's engine. Returns None on failure."""
+    return _call_worker_engine(lambda engine: engine.image_to_text(image, timeout), timeout)
+
 
+def _ocr_page_image_with_confidence(image: Image, timeout: int = 0, fast: bool = False) -> Optional[Tuple[str, float]]:
+    """Like _ocr_page_image, but returns (text, mean word confidence)."""
+    return _call_worker_engine(lambda engine: engine.image_to_text_with_confidence(image, timeout, fast), timeout)
 
-def get_text_from_pdf(pdf_path: str) -> list[str]:
-    """Extracts text from each page of a PDF in parallel using OCR."""
-    page_texts = []
+
+def _settings_snapshot() -> Dict:
+    """The current settings, including ones changed at runtime, for worker processes that start from a fresh import."""
+    return {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+
+
+class _PageJob:
+    """
+    What a page task needs to find its document in a long-lived worker: a key unique to the
+    extract_pages_from_pdf call, the PDF (a path for worker processes, the bytes for threads)
+    and, for worker processes, the settings in effect when the document was submitted.
+    """
+    __slots__ = ("key", "pdf_source", "settings_snapshot")
+
+    def __init__(self, pdf_source: Union[str, bytes, bytearray, memoryview], settings_snapshot: Optional[Dict] = None):
+        self.key = uuid.uuid4().hex
+        self.pdf_source = pdf_source
+        self.settings_snapshot = settings_snapshot
+
+
+def _init_page_worker(engine_name: str, lang: str, fast_tessdata_dir: Optional[str],
+                      log_files: Optional[List[str]] = None, opened: Optional[List] = None) -> None:
+    """
+    Pool initializer: creates the OCR engine once for the lifetime of the worker.
+    Worker processes also log to the parent's log files, and close their engine and documents
+    when they exit. Thread workers append (documents, engine) to opened instead, for their pool
+    to release documents as they finish and to close everything on shutdown.
+    """
+    for log_file in log_files or []:
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logging.getLogger().addHandler(handler)
+    docs = _worker_state.docs = OrderedDict()
+    engine = _worker_state.engine = create_ocr_engine(engine_name, lang, fast_tessdata_dir)
+    if opened is not None:
+        opened.append((docs, engine))
+    else:
+        # Runs in multiprocessing's exit handler, after the pool has told the worker to stop
+        Finalize(None, _close_page_worker, args=(docs, engine), exitpriority=0)
+
+
+def _close_page_worker(docs: Dict[str, fitz.Document], engine: OcrEngine) -> None:
+    """Releases a worker's OCR engine (Tesseract API handles) and its open PDF handles."""
     try:
-        doc = fitz.open(pdf_path)
-        page_texts = [""] * doc.page_count
-
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_page = {}
-            for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap(dpi=300)
-                img = Image.open(BytesIO(pix.tobytes("png")))
-                future = executor.submit(_ocr_page_image, img)
-                future_to_page[future] = page_num
-
-            for future in as_completed(future_to_page):
-                page_num = future_to_page[future]
-                try:
-                    text = future.result()
-                    page_texts[page_num] = text
-                    logger.info(f"✅ Processed page {page_num + 1}/{doc.page_count}")
-                except Exception as e:
-                    logger.error(f"Page {page_num + 1} failed: {e}")
+        engine.close()
+    except Exception as e:
+        logger.warning(f"⚠️ WARNING: Could not close the {engine.name} engine: {e}")
+    with _render_lock:
+        while docs:
+            docs.popitem()[1].close()
+
+
+def _worker_document(job: _PageJob) -> fitz.Document:
+    """
+    The worker's handle on job's PDF, opened on the worker's first page of it; call with
+    _render_lock held. Worker processes can't be told when a document is done, so each keeps
+    only the documents of the last MAX_CONCURRENT_MESSAGES jobs open and closes older ones.
+    """
+    docs = _worker_state.docs
+    doc = docs.get(job.key)
+    if doc is None:
+        doc = docs[job.key] = _open_pdf(job.pdf_source)
+        while len(docs) > max(1, settings.MAX_CONCURRENT_MESSAGES):
+            docs.popitem(last=False)[1].close()
+    else:
+        docs.move_to_end(job.key)
+    return doc
+
+
+class _PageThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool for page OCR. Each finished document's per-thread handles are closed by
+    release_document, and the OCR engines once shutdown has joined the threads.
+    """
+
+    def __init__(self, max_workers: int, engine_name: str, lang: str, fast_tessdata_dir: Optional[str]):
+        self._opened = []
+        super().__init__(max_workers=max_workers, initializer=_init_page_worker,
+                         initargs=(engine_name, lang, fast_tessdata_dir, None, self._opened))
+
+    def release_document(self, job: _PageJob) -> None:
+        """Closes every thread's handle on job's PDF; call once none of its pages are in flight."""
+        with _render_lock:
+            for docs, _ in self._opened:
+                doc = docs.pop(job.key, None)
+                if doc is not None:
+                    doc.close()
+
+    def shutdown(self, wait: bool = True, **kwargs) -> None:
+        super().shutdown(wait=wait, **kwargs)
+        # Without wait, threads may still be using their engines
+        if wait:
+            while self._opened:
+                _close_page_worker(*self._opened.pop())
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process in MB, or None if the platform can't report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _pixmap_to_image(pix: fitz.Pixmap) -> Image:
+    """
+    Copies a pixmap's raw samples into a PIL image without a PNG encode/decode round-trip.
+    The image owns its pixels, so the pixmap can be freed right away, under _render_lock.
+    """
+    mode = "L" if pix.n == 1 else "RGB"
+    # One copy either way: a grayscale image shares the bytes copy of the samples, while
+    # PIL decodes RGB into its own 4-byte pixels straight from the pixmap's buffer
+    samples = pix.samples if pix.n == 1 else (getattr(pix, "samples_mv", None) or pix.samples)
+    return Image.frombuffer(mode, (pix.width, pix.height), samples, "raw", mode, pix.stride, 1)
+
+
+def _render_page(page: fitz.Page, dpi: int, grayscale: bool) -> fitz.Pixmap:
+    """Renders a page for OCR; grayscale keeps one byte per pixel instead of three."""
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    return page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+
+
+def _page_area_share(rects: List[fitz.Rect], page_rect: fitz.Rect) -> float:
+    """Share of the page covered by the rectangles (clipped to the page; overlaps are counted once per rectangle, capped at 1)."""
+    page_area = abs(page_rect)
+    if page_area <= 0:
+        return 0.0
+    return min(1.0, sum(abs(fitz.Rect(rect) & page_rect) for rect in rects) / page_area)
+
+
+def _text_layer_covers_images(page: fitz.Page) -> bool:
+    """
+    False for a scan with only a thin real text line on top, such as an e-filing header stamped
+    onto a full-page image: images cover at least TEXT_LAYER_MAX_IMAGE_COVERAGE of the page
+    while the text blocks cover less than TEXT_LAYER_MIN_TEXT_COVERAGE. Scans with a full
+    (searchable, often invisible) OCR text layer still pass.
+    """
+    image_coverage = _page_area_share([info["bbox"] for info in page.get_image_info()], page.rect)
+    if image_coverage < settings.TEXT_LAYER_MAX_IMAGE_COVERAGE:
+        return True
+    text_blocks = [block[:4] for block in page.get_text("blocks") if block[6] == 0]
+    return _page_area_share(text_blocks, page.rect) >= settings.TEXT_LAYER_MIN_TEXT_COVERAGE
+
+
+def _text_layer_is_usable(text: str, page: Optional[fitz.Page] = None) -> bool:
+    """
+    Quality gate for a page's native text layer.
+    The layer is accepted only if it has enough characters, is mostly printable,
+    and MuPDF could map (almost) every glyph to a character (unmapped glyphs come back as U+FFFD).
+    Given the page, a text layer that leaves most of an image-covered page without text is
+    rejected too (see _text_layer_covers_images), so the image body gets OCRed.
+    """
+    stripped = text.strip()
+    if not stripped or len(stripped) < settings.TEXT_LAYER_MIN_CHARS:
+        return False
+    printable = sum(1 for c in text if c.isprintable() or c.isspace())
+    if printable / len(text) < settings.TEXT_LAYER_MIN_PRINTABLE_RATIO:
+        return False
+    glyphs = [c for c in stripped if not c.isspace()]
+    mapped = sum(1 for c in glyphs if c != "\ufffd")
+    if mapped / len(glyphs) < settings.TEXT_LAYER_MIN_GLYPH_COVERAGE:
+        return False
+    return page is None or _text_layer_covers_images(page)
+
+
+def _is_blank_page(page: fitz.Page) -> bool:
+    """
+    Vectorized blank/near-blank check on a low-resolution grayscale render.
+    A page is blank when both the share of ink pixels (darker than BLANK_INK_LEVEL) and the
+    pixel standard deviation stay under their thresholds, which tolerates scanner noise
+    and faint borders on duplex back sides and separator sheets.
+    """
+    pix = page.get_pixmap(dpi=settings.BLANK_DETECTION_DPI, colorspace=fitz.csGRAY, alpha=False)
+    # pix.samples is a copy, so the array never outlives the pixmap's buffer
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    ink_ratio = np.count_nonzero(pixels < settings.BLANK_INK_LEVEL) / pixels.size
+    return ink_ratio <= settings.BLANK_MAX_INK_RATIO and float(pixels.std()) <= settings.BLANK_MAX_STDDEV
+
+
+def _page_result_without_ocr(page: fitz.Page, use_text_layer: bool) -> Optional[Dict]:
+    """The text-layer or blank-page result for a page that needs no OCR, or None; call with _render_lock held."""
+    text_layer = page.get_text() if use_text_layer or settings.BLANK_DETECTION_ENABLED else ""
+    if use_text_layer and _text_layer_is_usable(text_layer, page):
+        return {"text": text_layer, "source": PAGE_SOURCE_TEXT_LAYER}
+    if settings.BLANK_DETECTION_ENABLED and not text_layer.strip() and _is_blank_page(page):
+        return {"text": "", "source": PAGE_SOURCE_BLANK, "blank": True}
+    return None
+
+
+def _process_worker_page(job: _PageJob, page_num: int, dpi: int, timeout: int, use_text_layer: bool) -> Dict:
+    """
+    Extracts one page of job's document, opened once per worker (see _worker_document).
+    Born-digital pages whose text layer passes the quality gate skip Tesseract entirely;
+    everything else is rendered and OCRed. The page is rendered here, inside the worker,
+    so at most one rendered image per worker is alive at any time.
+    The worker's peak RSS rides along under "peak_rss_mb" and is stripped by the caller.
+    A page whose OCR failed or timed out comes back with empty text and "failed": True.
+    Blank pages (no text layer and no ink on a low-resolution render) skip OCR and come back
+    with empty text and "blank": True.
+    """
+    # Worker processes outlive settings changes made in the parent after they started
+    for name, value in (job.settings_snapshot or {}).items():
+        setattr(settings, name, value)
+    with _render_lock:
+        doc = _worker_document(job)
+        page = doc.load_page(page_num)
+        try:
+            result = _page_result_without_ocr(page, use_text_layer)
+        finally:
+            # MuPDF objects are freed while the lock is held, too
+            del page
+    if result is not None:
+        result["peak_rss_mb"] = _peak_rss_mb()
+        return result
+
+    if settings.OCR_ADAPTIVE_DPI and settings.OCR_LOW_DPI < dpi:
+        result = _ocr_page_adaptive(doc, page_num, dpi, timeout)
+    else:
+        text, _, seconds = _ocr_page_at_dpi(doc, page_num, dpi, timeout)
+        result = {"text": text or "", "source": PAGE_SOURCE_OCR, "dpi": dpi, "ocr_seconds": round(seconds, 3)}
+        if text is None:
+            result["failed"] = True
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _ocr_page_at_dpi(doc: fitz.Document, page_num: int, dpi: int, timeout: int, with_confidence: bool = False, fast: bool = False) -> Tuple[Optional[str], float, float]:
+    """
+    Renders one page at the given DPI and OCRs it.
+    Returns (text or None on failure, mean word confidence or 0.0, OCR seconds).
+    """
+    with _render_lock:
+        page = doc.load_page(page_num)
+        pix = _render_page(page, dpi, settings.OCR_GRAYSCALE)
+        img = _pixmap_to_image(pix)
+        # Free the page and pixmap before releasing the lock; only the OCR call runs outside it
+        del page, pix
+    start = time.perf_counter()
+    if with_confidence:
+        text, confidence = _ocr_page_image_with_confidence(img, timeout, fast) or (None, 0.0)
+    else:
+        text, confidence = _ocr_page_image(img, timeout), 0.0
+    seconds = time.perf_counter() - start
+    return text, confidence, seconds
+
+
+def _ocr_page_adaptive(doc: fitz.Document, page_num: int, dpi: int, timeout: int) -> Dict:
+    """
+    Tiered OCR: the page is first OCRed at Settings.OCR_LOW_DPI (with the fast model when
+    Settings.OCR_FAST_TESSDATA_DIR is set) and only re-rendered and re-OCRed at full DPI
+    when the mean word confidence falls below Settings.OCR_CONFIDENCE_THRESHOLD.
+    """
+    fast = bool(settings.OCR_FAST_TESSDATA_DIR)
+    text, confidence, low_seconds = _ocr_page_at_dpi(doc, page_num, settings.OCR_LOW_DPI, timeout, with_confidence=True, fast=fast)
+    result = {"source": PAGE_SOURCE_OCR, "confidence": round(confidence, 1)}
+    if text is not None and confidence >= settings.OCR_CONFIDENCE_THRESHOLD:
+        result.update({"text": text, "dpi": settings.OCR_LOW_DPI, "escalated": False, "ocr_seconds": round(low_seconds, 3)})
+        return result
+
+    text, _, high_seconds = _ocr_page_at_dpi(doc, page_num, dpi, timeout)
+    result.update({
+        "text": text or "",
+        "dpi": dpi,
+        "escalated": True,
+        "ocr_seconds": round(low_seconds + high_seconds, 3),
+        "high_dpi_seconds": round(high_seconds, 3),
+    })
+    if text is None:
+        result["failed"] = True
+    return result
+
+
+def _log_adaptive_ocr_stats(processed_pages: List[Dict], dpi: int) -> None:
+    """
+    Logs the escalation rate and an estimate of the OCR time saved by adaptive resolution.
+    Full-DPI cost per page is taken from the escalated pages when there are any, otherwise it is
+    extrapolated from the low-DPI passes by pixel count. Escalated pages count against the saving
+    with the cost of their wasted low-DPI pass.
+    """
+    tiered_pages = [p for p in processed_pages if "escalated" in p]
+    if not tiered_pages:
+        return
+    escalated = [p for p in tiered_pages if p["escalated"]]
+    if escalated:
+        full_dpi_seconds = sum(p["high_dpi_seconds"] for p in escalated) / len(escalated)
+    else:
+        low_dpi_seconds = sum(p["ocr_seconds"] for p in tiered_pages) / len(tiered_pages)
+        full_dpi_seconds = low_dpi_seconds * (dpi / settings.OCR_LOW_DPI) ** 2
+    saved_seconds = sum(full_dpi_seconds - p["ocr_seconds"] for p in tiered_pages)
+    logger.info(f"📊 Adaptive OCR: {len(escalated)}/{len(tiered_pages)} pages escalated to {dpi} DPI ({len(escalated) / len(tiered_pages):.1%}), estimated OCR time saved {saved_seconds:.2f}s")
+
+
+def _ocr_cache_params(engine_name: str) -> Dict:
+    """Every setting that changes the extracted text, and therefore belongs in the OCR cache key."""
+    return {
+        "dpi": settings.OCR_DPI,
+        "lang": settings.OCR_LANG,
+        "engine": engine_name,
+        "grayscale": settings.OCR_GRAYSCALE,
+        "adaptive": [
+            settings.OCR_ADAPTIVE_DPI,
+            settings.OCR_LOW_DPI,
+            settings.OCR_CONFIDENCE_THRESHOLD,
+            settings.OCR_FAST_TESSDATA_DIR,
+        ],
+        "blank": [
+            settings.BLANK_DETECTION_ENABLED,
+            settings.BLANK_DETECTION_DPI,
+            settings.BLANK_INK_LEVEL,
+            settings.BLANK_MAX_INK_RATIO,
+            settings.BLANK_MAX_STDDEV,
+        ],
+        "text_layer": [
+            settings.TEXT_LAYER_ENABLED,
+            settings.TEXT_LAYER_MIN_CHARS,
+            settings.TEXT_LAYER_MIN_PRINTABLE_RATIO,
+            settings.TEXT_LAYER_MIN_GLYPH_COVERAGE,
+            settings.TEXT_LAYER_MAX_IMAGE_COVERAGE,
+            settings.TEXT_LAYER_MIN_TEXT_COVERAGE,
+        ],
+    }
+
+
+def _log_ocr_cache_stats(outcome: str) -> None:
+    stats = ocr_result_cache.stats()
+    logger.info(f"📊 OCR cache {outcome}: hits={stats['hits']} misses={stats['misses']} evictions={stats['evictions']} hit rate={stats['hit_rate']:.1%}")
+
+
+def _create_page_executor(mode: str, max_workers: int, engine_name: str) -> Executor:
+    """Builds the page-OCR executor for the requested mode."""
+    initargs = (engine_name, settings.OCR_LANG, settings.OCR_FAST_TESSDATA_DIR or None)
+    if mode == OCR_EXECUTOR_PROCESS:
+        log_files = [handler.baseFilename for handler in logging.getLogger().handlers if isinstance(handler, logging.FileHandler)]
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=_page_pool_context,
+                                   initializer=_init_page_worker, initargs=initargs + (log_files,))
+    if mode == OCR_EXECUTOR_THREAD:
+        return _PageThreadPoolExecutor(max_workers, *initargs)
+    raise ValueError(f"Unknown OCR executor mode '{mode}' (expected '{OCR_EXECUTOR_PROCESS}' or '{OCR_EXECUTOR_THREAD}')")
+
+
+def _get_page_pool(mode: str, max_workers: int, engine_name: str) -> Executor:
+    """
+    The page pool for this configuration, created on first use and shared by every later
+    document (and by concurrent messages). Workers are started on demand, up to max_workers.
+    """
+    key = (mode, max_workers, engine_name, settings.OCR_LANG, settings.OCR_FAST_TESSDATA_DIR)
+    with _page_pools_lock:
+        pool = _page_pools.get(key)
+        if pool is None:
+            pool = _page_pools[key] = _create_page_executor(mode, max_workers, engine_name)
+        return pool
+
+
+def _discard_page_pool(pool: Executor) -> None:
+    """Drops a broken pool (a worker process died), so the next document starts a new one."""
+    with _page_pools_lock:
+        for key in [key for key, value in _page_pools.items() if value is pool]:
+            del _page_pools[key]
+    pool.shutdown(wait=False)
+
+
+def shutdown_page_pools() -> None:
+    """Shuts down the page pools, closing their workers' OCR engines and documents. Call when the service stops."""
+    with _page_pools_lock:
+        pools = list(_page_pools.values())
+        _page_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
 
-        return page_texts
+@contextmanager
+def _worker_pdf_source(mode: str, pdf_source: Union[str, bytes, bytearray, memoryview]):
+    """
+    The PDF as the page workers should open it. Worker processes get a path: in-memory PDFs
+    are written once to a temporary file (removed afterwards) instead of being pickled into
+    every worker, which would keep a full copy per process. Thread workers share the bytes.
+    """
+    if mode != OCR_EXECUTOR_PROCESS or isinstance(pdf_source, str):
+        yield pdf_source
+        return
+    fd, path = tempfile.mkstemp(prefix="ocr_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_source)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"⚠️ WARNING: Could not remove temporary PDF {path}: {e}")
+
+
+# Indirect reference ("12 0 R") inside an object definition
+_OBJECT_REFERENCE = re.compile(r"(\d+) (\d+) R")
+# Links up or across the form/annotation trees (field parents and kids, popups), which lead to other pages
+_TREE_REFERENCE = re.compile(r"/(Parent|Kids|Popup)\s*(\d+ \d+ R|\[[^\]]*\])")
+
+
+def _resolve_references(doc: fitz.Document, definition: str, digests: Dict[int, bytes]) -> str:
+    """definition with tree links dropped and each reference replaced by the referenced object's digest."""
+    definition = _TREE_REFERENCE.sub(r"/\1", definition)
+    return _OBJECT_REFERENCE.sub(lambda ref: _object_digest(doc, int(ref.group(1)), digests).hex(), definition)
+
+
+def _object_digest(doc: fitz.Document, xref: int, digests: Dict[int, bytes]) -> bytes:
+    """
+    SHA-256 of a PDF object and everything it references: its definition, with each reference
+    replaced by the referenced object's digest (so equal objects match whatever their xref
+    numbers), plus its raw stream. Page objects and field parents/kids are not followed
+    (annotations point back to their page, fields to the widgets of other pages).
+    Memoized per document in digests.
+    """
+    cached = digests.get(xref)
+    if cached is not None:
+        return cached
+    if doc.xref_get_key(xref, "Type") in (("name", "/Page"), ("name", "/Pages")):
+        digests[xref] = hashlib.sha256(b"page").digest()
+        return digests[xref]
+    digests[xref] = b"cycle"  # Placeholder while the references are followed
+    definition = _resolve_references(doc, doc.xref_object(xref, compressed=True), digests)
+    digest = hashlib.sha256(definition.encode('utf-8'))
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    digests[xref] = digest.digest()
+    return digests[xref]
+
+
+def _page_resources(doc: fitz.Document, page: fitz.Page) -> str:
+    """The page's /Resources entry, inherited from the page tree when the page has none ("" if there is none)."""
+    xref, seen = page.xref, set()
+    while xref not in seen:
+        seen.add(xref)
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(parent.split()[0])
+    return ""
+
+
+def _page_fingerprint(doc: fitz.Document, page: fitz.Page, digests: Optional[Dict[int, bytes]] = None) -> str:
+    """
+    Cheap content fingerprint of a page, computed without rendering.
+    Hashes the page geometry, its content stream, its /Resources with every reference
+    resolved by content, and its annotations and form widgets with their appearance streams
+    and field values. The resources carry the name bindings the content stream draws through,
+    the image dictionaries (Decode, ColorSpace, SMask, size) and raw streams, form XObjects,
+    and fonts with their font programs, ToUnicode CMaps and encodings.
+    Byte-identical pages, such as a cover sheet repeated within a bundle, get the same
+    fingerprint. digests memoizes _object_digest across the pages of one document, so
+    shared fonts and images are hashed once.
+    """
+    digests = {} if digests is None else digests
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)}|{page.rotation}".encode('utf-8'))
+    digest.update(page.read_contents())
+    digest.update(_resolve_references(doc, _page_resources(doc, page), digests).encode('utf-8'))
+    # The /Annots array, in order: stamps, notes, links and form widgets
+    for xref, _, _ in page.annot_xrefs():
+        digest.update(_object_digest(doc, xref, digests))
+    for widget in page.widgets():
+        # Field values can be inherited from a parent field
+        digest.update(f"|{widget.field_name}|{widget.field_type}|{widget.field_value}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _fingerprint_pages(pdf_source: Union[str, bytes, bytearray, memoryview]) -> Tuple[int, List[Optional[str]]]:
+    """Returns the page count and a fingerprint per page (None where fingerprinting failed or is disabled)."""
+    with _render_lock, _open_pdf(pdf_source) as doc:
+        if not settings.PAGE_DEDUP_ENABLED:
+            return doc.page_count, [None] * doc.page_count
+        fingerprints = []
+        digests: Dict[int, bytes] = {}
+        for page_num in range(doc.page_count):
+            page = doc.load_page(page_num)
+            try:
+                fingerprints.append(_page_fingerprint(doc, page, digests))
+            except Exception as e:
+                logger.warning(f"⚠️ WARNING: Could not fingerprint page {page_num + 1}: {e}")
+                fingerprints.append(None)
+            finally:
+                del page  # Freed under the lock, not when the function returns
+        return doc.page_count, fingerprints
+
+
+def extract_pages_from_pdf(pdf_source: PdfSource, executor_mode: Optional[str] = None, max_workers: Optional[int] = None, engine_name: Optional[str] = None) -> List[Dict]:
+    """
+    Extracts text from each page of a PDF in parallel.
+    pdf_source is a file path, or the PDF's bytes / a binary buffer, which is opened
+    straight from memory (no write-out and re-read of the file before OCR).
+
+    Returns one dict per page: {"page": 1-based number, "text": str, "source": "text_layer" | "ocr" | "blank"};
+    blank pages also carry "blank": True and failed pages "failed": True.
+    The executor mode, pool size and OCR backend default to Settings.OCR_EXECUTOR,
+    Settings.MAX_WORKERS and Settings.OCR_ENGINE; they can be overridden to compare pages/sec scaling.
+    Each OCRed page is bounded by Settings.TESSERACT_TIMEOUT.
+
+    Pages are fed to the pool lazily: at most workers * Settings.OCR_PAGES_IN_FLIGHT_PER_WORKER
+    pages are outstanding at once, so memory scales with the worker count, not the page count.
+
+    When Settings.OCR_CACHE_ENABLED is set, results are looked up by PDF content hash before
+    anything is rendered, and fully successful results are stored for the next delivery.
+    With Settings.PAGE_DEDUP_ENABLED, pages are fingerprinted first: each distinct page is
+    processed once per document, and pages already seen in earlier documents are served
+    from the shared page cache.
+    """
+    pages = []
+    try:
+        pdf_source = _normalize_pdf_source(pdf_source)
+        mode = (executor_mode or settings.OCR_EXECUTOR).lower()
+        engine_name = (engine_name or settings.OCR_ENGINE).lower()
+        _get_ocr_engine_class(engine_name).check_available()
+        cache_params = _ocr_cache_params(engine_name)
+
+        cache_key = None
+        if settings.OCR_CACHE_ENABLED:
+            pdf_sha256 = sha256_of_file(pdf_source) if isinstance(pdf_source, str) else sha256_of_bytes(pdf_source)
+            cache_key = ocr_result_cache.make_key(pdf_sha256, cache_params)
+            cached_pages = ocr_result_cache.get(cache_key)
+            if cached_pages is not None:
+                _log_ocr_cache_stats("hit")
+                logger.info(f"♻️ OCR cache hit: {len(cached_pages)} pages served without rendering")
+                return cached_pages
+            _log_ocr_cache_stats("miss")
+
+        page_count, fingerprints = _fingerprint_pages(pdf_source)
+        pages = [{"page": n + 1, "text": "", "source": PAGE_SOURCE_OCR} for n in range(page_count)]
+        if page_count == 0:
+            return pages
+
+        # Resolve duplicates before anything is rendered: pages known to the shared page cache
+        # are filled in directly, and repeats within this document wait for their first occurrence.
+        page_keys = [OcrResultCache.make_key(fp, cache_params) if fp else None for fp in fingerprints]
+        first_page_for_key = {}
+        duplicates_of = {}
+        pages_to_process = []
+        cached_page_count = 0
+        for page_num, page_key in enumerate(page_keys):
+            if page_key is None:
+                pages_to_process.append(page_num)
+            elif page_key in first_page_for_key:
+                duplicates_of[page_num] = first_page_for_key[page_key]
+            else:
+                first_page_for_key[page_key] = page_num
+                cached_result = page_result_cache.get(page_key)
+                if cached_result is not None:
+                    pages[page_num].update(cached_result)
+                    cached_page_count += 1
+                else:
+                    pages_to_process.append(page_num)
+
+        workers = max(1, min(max_workers or settings.MAX_WORKERS, max(1, len(pages_to_process))))
+        logger.info(f"🔧 OCR executor: {mode} with {workers} workers, {engine_name} engine, {settings.OCR_DPI} DPI, {settings.TESSERACT_TIMEOUT}s page timeout, text layer {'on' if settings.TEXT_LAYER_ENABLED else 'off'}")
+        ocr_start_time = time.time()
+
+        max_in_flight = workers * max(1, settings.OCR_PAGES_IN_FLIGHT_PER_WORKER)
+        worker_peak_rss_mb = 0.0
+
+        if pages_to_process:
+            executor = _get_page_pool(mode, max(1, max_workers or settings.MAX_WORKERS), engine_name)
+            with _worker_pdf_source(mode, pdf_source) as worker_pdf_source:
+                # Worker processes outlive this call, so they get the settings in effect now
+                job = _PageJob(worker_pdf_source, _settings_snapshot() if mode == OCR_EXECUTOR_PROCESS else None)
+                pending_pages = iter(pages_to_process)
+                next_page = next(pending_pages, None)
+                future_to_page = {}
+                try:
+                    while next_page is not None or future_to_page:
+                        # Top up the in-flight window, then wait for at least one page to finish
+                        while next_page is not None and len(future_to_page) < max_in_flight:
+                            future = executor.submit(_process_worker_page, job, next_page, settings.OCR_DPI, settings.TESSERACT_TIMEOUT, settings.TEXT_LAYER_ENABLED)
+                            future_to_page[future] = next_page
+                            next_page = next(pending_pages, None)
+
+                        done, _ = wait(future_to_page, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            page_num = future_to_page.pop(future)
+                            try:
+                                result = future.result()
+                                worker_peak_rss_mb = max(worker_peak_rss_mb, result.pop("peak_rss_mb", None) or 0.0)
+                                pages[page_num].update(result)
+                                if page_keys[page_num] and not result.get("failed"):
+                                    page_result_cache.put(page_keys[page_num], result)
+                                logger.info(f"✅ Processed page {page_num + 1}/{page_count} ({pages[page_num]['source']})")
+                            except BrokenExecutor:
+                                raise
+                            except Exception as e:
+                                pages[page_num]["failed"] = True
+                                logger.error(f"Page {page_num + 1} failed: {e}")
+                except BrokenExecutor:
+                    _discard_page_pool(executor)
+                    raise
+                finally:
+                    # The pool is shared: don't leave this document's pages running after an error
+                    for future in future_to_page:
+                        future.cancel()
+                    wait(future_to_page)
+                    if isinstance(executor, _PageThreadPoolExecutor):
+                        executor.release_document(job)
+
+        for page_num, source_page_num in duplicates_of.items():
+            pages[page_num].update({k: v for k, v in pages[source_page_num].items() if k != "page"})
+
+        ocr_duration = time.time() - ocr_start_time
+        pages_per_sec = page_count / ocr_duration if ocr_duration > 0 else 0.0
+        text_layer_pages = sum(1 for p in pages if p["source"] == PAGE_SOURCE_TEXT_LAYER)
+        blank_pages = sum(1 for p in pages if p.get("blank"))
+        logger.info(f"📊 OCR throughput: {page_count} pages in {ocr_duration:.2f}s ({pages_per_sec:.2f} pages/sec, {mode} x{workers})")
+        logger.info(f"📊 Page sources: {text_layer_pages} text layer, {blank_pages} blank, {page_count - text_layer_pages - blank_pages} OCR")
+        if settings.OCR_ADAPTIVE_DPI:
+            _log_adaptive_ocr_stats([pages[n] for n in pages_to_process], settings.OCR_DPI)
+        if settings.PAGE_DEDUP_ENABLED:
+            avoided = page_count - len(pages_to_process)
+            logger.info(f"📊 Page dedup: {len(pages_to_process)}/{page_count} pages processed, {len(duplicates_of)} in-document duplicates, {cached_page_count} from page cache (dedup ratio {avoided / page_count:.1%}, page cache hits={page_result_cache.hits} misses={page_result_cache.misses})")
+        main_peak_rss_mb = _peak_rss_mb()
+        if main_peak_rss_mb is not None:
+            # Workers and the main process both outlive documents, so these are lifetime peaks.
+            logger.info(f"📊 Peak RSS: workers {worker_peak_rss_mb:.1f} MB ({mode} x{workers}, max {max_in_flight} pages in flight), main process {main_peak_rss_mb:.1f} MB")
+
+        failed_pages = sum(1 for p in pages if p.get("failed"))
+        if cache_key and not failed_pages:
+            ocr_result_cache.put(cache_key, pages)
+        elif failed_pages:
+            logger.warning(f"⚠️ WARNING: {failed_pages} pages failed OCR; result not cached")
+        return pages
     except Exception as e:
-        logger.error(f"Failed to process PDF '{pdf_path}': {e}")
+        logger.error(f"Failed to process PDF {_describe_pdf_source(pdf_source)}: {e}")
         return []
 
+
+def get_text_from_pdf(pdf_source: PdfSource, executor_mode: Optional[str] = None, max_workers: Optional[int] = None, engine_name: Optional[str] = None) -> list[str]:
+    """Extracts the text of each page of a PDF given as a path or as bytes/buffer (see extract_pages_from_pdf)."""
+    return [page["text"] for page in extract_pages_from_pdf(pdf_source, executor_mode, max_workers, engine_name)]
+
 # ---------------- HELPER FUNCTIONS (To match C# logic) ----------------
 def normalize_text(text: str) -> str:
     """Replaces all whitespace sequences with a single space."""
-    return re.sub(r"\s+", " ", text).strip()
+    # Same result as re.sub(r"\s+", " ", text).strip(): str.split() and \s agree on every whitespace character
+    return " ".join(text.split())
 
 def _is_exact_match(identifier: str) -> bool:
     """Helper to check for 'ExactMatch:' prefix, like C#'s IsContainsOnly."""
@@ -292,11 +1147,13 @@ def count_occurrences(page_text: str, identifier: str) -> int:
         return 0
     return len(re.findall(re.escape(identifier), page_text, re.IGNORECASE))
 
-def _is_page_demarcated(page_num: int, demarcated_ranges: List[Tuple[int, int]]) -> bool:
+def _is_page_demarcated(page_num: int, demarcated_ranges: Union["DemarcationSession", List[Tuple[int, int]]]) -> bool:
     """Checks if a page falls within any already identified document range."""
+    if isinstance(demarcated_ranges, DemarcationSession):
+        return demarcated_ranges.is_page_demarcated(page_num)
     return any(start <= page_num <= end for start, end in demarcated_ranges)
 
-def _is_range_overlapping(new_range: Tuple[int, int], demarcated_ranges: List[Tuple[int, int]]) -> bool:
+def _is_range_overlapping(new_range: Tuple[int, int], demarcated_ranges: Union["DemarcationSession", List[Tuple[int, int]]]) -> bool:
     """
     Checks if the new page range overlaps with any existing demarcated ranges.
     This is the direct Python equivalent of the C# IsPageRangeOverlapping logic.
@@ -305,7 +1162,14 @@ def _is_range_overlapping(new_range: Tuple[int, int], demarcated_ranges: List[Tu
     # A zero-page range cannot overlap
     if new_start == 0 or new_end == 0:
         return False
-        
+
+    if isinstance(demarcated_ranges, DemarcationSession):
+        overlapping = demarcated_ranges.overlapping_range(new_range)
+        if overlapping is not None:
+            logger.warning(f"Overlap detected for range {new_range}. It overlaps with existing range {overlapping}.")
+            return True
+        return False
+
     for start, end in demarcated_ranges:
         # Classic interval overlap check
         if new_start <= end and new_end >= start:
@@ -314,69 +1178,408 @@ def _is_range_overlapping(new_range: Tuple[int, int], demarcated_ranges: List[Tu
     return False
 
 
+class PageTextIndex:
+    """
+    Normalized (normalize_text) and lower-cased page texts, shared by all rules of a document
+    so the demarcation helpers don't re-normalize every page for every rule and identifier.
+    Each page is normalized on first use; searches that stop early never touch the rest.
+
+    Substring identifiers (from a RuleSet, or registered with add_identifiers()) are matched
+    against a page all at once by an Aho-Corasick automaton (pyahocorasick), and the
+    per-identifier counts are kept per page for every rule that looks at it again. Without
+    pyahocorasick each identifier is counted with str.count the first time a rule asks for it
+    on that page.
+    """
+    __slots__ = ("_pages_text", "_normalized", "_lowered", "_counts", "_patterns", "_automaton")
+
+    def __init__(self, pdf_pages_text: List[str]):
+        self._pages_text = pdf_pages_text
+        self._normalized: List[Optional[str]] = [None] * len(pdf_pages_text)
+        self._lowered: List[Optional[str]] = [None] * len(pdf_pages_text)
+        self._counts: List[Optional[Dict[str, int]]] = [None] * len(pdf_pages_text)
+        self._patterns = frozenset()
+        self._automaton = None
+
+    def __len__(self) -> int:
+        return len(self._pages_text)
+
+    def normalized(self, page_num: int) -> str:
+        """normalize_text() of the page (0-based)."""
+        page_text = self._normalized[page_num]
+        if page_text is None:
+            page_text = self._normalized[page_num] = normalize_text(self._pages_text[page_num])
+        return page_text
+
+    def lowered(self, page_num: int) -> str:
+        """The normalized page, lower-cased."""
+        page_text = self._lowered[page_num]
+        if page_text is None:
+            page_text = self._lowered[page_num] = self.normalized(page_num).lower()
+        return page_text
+
+    def use_rule_set(self, rule_set: "RuleSet") -> None:
+        """Matches the rule set's identifiers with its prebuilt automaton."""
+        self._patterns = rule_set.patterns
+        self._automaton = rule_set.automaton
+        self._counts = [None] * len(self._pages_text)
+
+    def add_identifiers(self, identifiers: List["CompiledIdentifier"]) -> None:
+        """Registers the substring identifiers of _split_identifiers() output; new ones reset the per-page counts."""
+        new_patterns = {identifier.lowered for identifier in identifiers if not identifier.exact_match} - self._patterns
+        if not new_patterns:
+            return
+        self._patterns |= new_patterns
+        self._counts = [None] * len(self._pages_text)
+        self._automaton = _build_automaton(self._patterns)
+
+    def identifier_count(self, page_num: int, lowered_identifier: str) -> int:
+        """Non-overlapping occurrences of a lower-cased identifier in the lower-cased page (0 if absent)."""
+        counts = self._counts[page_num]
+        if counts is None:
+            counts = self._counts[page_num] = self._scan(page_num) if self._automaton is not None else {}
+        count = counts.get(lowered_identifier)
+        if count is None:
+            if self._automaton is not None and lowered_identifier in self._patterns:
+                return 0  # Scanned for and not on the page
+            count = counts[lowered_identifier] = self.lowered(page_num).count(lowered_identifier)
+        return count
+
+    def _scan(self, page_num: int) -> Dict[str, int]:
+        """One automaton pass over the page: counts of the registered identifiers that occur."""
+        counts: Dict[str, int] = {}
+        # Matches come in end order; keep each pattern's leftmost non-overlapping ones, as str.count does
+        last_end: Dict[str, int] = {}
+        for end, pattern in self._automaton.iter(self.lowered(page_num)):
+            if end - len(pattern) >= last_end.get(pattern, -1):
+                last_end[pattern] = end
+                counts[pattern] = counts.get(pattern, 0) + 1
+        return counts
+
+def _build_automaton(patterns: frozenset):
+    """Aho-Corasick automaton over the lower-cased patterns, or None without pyahocorasick (or patterns)."""
+    if ahocorasick is None or not patterns:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pattern in patterns:
+        automaton.add_word(pattern, pattern)
+    automaton.make_automaton()
+    return automaton
+
+def _page_text_index(pages: Union[PageTextIndex, List[str]]) -> PageTextIndex:
+    return pages if isinstance(pages, PageTextIndex) else PageTextIndex(pages)
+
+class DemarcationSession:
+    """
+    State of one demarcate_document run: the document's PageTextIndex and the page ranges
+    claimed so far. Claimed pages are marked in a bitmap over 1..total_pages for O(1) page
+    lookups, and the (disjoint) ranges are also kept sorted by start, so an overlap check is
+    two bisects instead of a scan of every range.
+    """
+    __slots__ = ("pages", "total_pages", "demarcated_ranges", "_occupied", "_starts", "_ends", "_claim_order")
+
+    def __init__(self, pdf_pages_text: Union[PageTextIndex, List[str]]):
+        self.pages = _page_text_index(pdf_pages_text)
+        self.total_pages = len(self.pages)
+        self.demarcated_ranges: List[Tuple[int, int]] = []  # In claim order
+        self._occupied = bytearray(self.total_pages + 1)
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._claim_order: List[int] = []
+
+    def is_page_demarcated(self, page_num: int) -> bool:
+        if 1 <= page_num <= self.total_pages:
+            return self._occupied[page_num] == 1
+        # Offsets can put a page (or a claimed range) past the end of the document
+        i = bisect.bisect_right(self._starts, page_num) - 1
+        return i >= 0 and page_num <= self._ends[i]
+
+    def overlapping_range(self, new_range: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        """The earliest-claimed range that overlaps new_range (the one a scan in claim order reports), or None."""
+        new_start, new_end = new_range
+        # Claimed ranges are disjoint, so ends are sorted too: overlaps are those starting at or before
+        # new_end and ending at or after new_start, a contiguous run of the sorted ranges
+        first = bisect.bisect_left(self._ends, new_start)
+        last = bisect.bisect_right(self._starts, new_end)
+        if first >= last:
+            return None
+        return self.demarcated_ranges[min(self._claim_order[first:last])]
+
+    def claim(self, new_range: Tuple[int, int]) -> bool:
+        """Records a valid range (1 <= start <= end) unless it overlaps a claimed one, which is logged and rejected."""
+        if _is_range_overlapping(new_range, self):
+            return False
+        start, end = new_range
+        i = bisect.bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._claim_order.insert(i, len(self.demarcated_ranges))
+        self.demarcated_ranges.append(new_range)
+        first_page, last_page = max(start, 1), min(end, self.total_pages)
+        if first_page <= last_page:
+            self._occupied[first_page:last_page + 1] = b"\x01" * (last_page - first_page + 1)
+        return True
+
+class CompiledIdentifier:
+    """
+    One '|'-separated identifier, normalized, with any ExactMatch: prefix removed. Substring
+    identifiers carry the case-insensitive pattern count_occurrences would build for them.
+    """
+    __slots__ = ("identifier", "lowered", "exact_match", "is_ascii", "pattern")
+
+    def __init__(self, identifier: str, exact_match: bool):
+        self.identifier = identifier
+        self.lowered = identifier.lower()
+        self.exact_match = exact_match
+        self.is_ascii = identifier.isascii()
+        self.pattern = None if exact_match else re.compile(re.escape(identifier), re.IGNORECASE)
+
+    def count_in(self, page_text: str) -> int:
+        """count_occurrences(page_text, identifier) with the precompiled pattern."""
+        if not page_text or not self.identifier:
+            return 0
+        return len(self.pattern.findall(page_text))
+
+def _split_identifiers(identifiers: str) -> List[CompiledIdentifier]:
+    """A CompiledIdentifier per '|'-separated identifier, skipping blank ones."""
+    split_identifiers = []
+    for identifier in identifiers.split('|'):
+        if not identifier.strip():
+            continue
+        identifier = normalize_text(identifier)
+        exact_match = _is_exact_match(identifier)
+        if exact_match:
+            identifier = _clean_exact_match_identifier(identifier)
+        split_identifiers.append(CompiledIdentifier(identifier, exact_match))
+    return split_identifiers
+
+# Identifier fields that define a demarcation rule. main.py copies message metadata (DocReceivedId,
+# FirmFile, ...) into every identifier; those are echoed into the rows but don't change the rule.
+RULE_FIELDS = ("Sequence", "StartingIdentifier", "StartingIdentifierPlus1", "EndingIdentifier", "EndingIdentifierMinus1",
+               "NoOfPages", "Occurence", "StartingMinusN", "EndingMinusN")
+
+class CompiledRule:
+    """
+    One identifier of a message, parsed as demarcate_document applies it. The first-page search
+    uses StartingIdentifierPlus1 (shifted by StartingMinusN) if present, else StartingIdentifier;
+    first_identifiers is None when neither is given (the document starts on page 1). Likewise the
+    last-page search uses EndingIdentifierMinus1 (shifted back by EndingMinusN), else
+    EndingIdentifier; last_identifiers is None when neither is given (it ends on the last page).
+    """
+    __slots__ = ("index", "first_identifiers", "first_offset", "last_identifiers", "last_offset", "no_of_pages", "occurrence")
+
+    def __init__(self, index: int, ident: Dict):
+        self.index = index  # Position in the message's Identifiers list
+        start_id = ident.get("StartingIdentifier", "").strip()
+        start_id_plus1 = ident.get("StartingIdentifierPlus1", "").strip()
+        end_id = ident.get("EndingIdentifier", "").strip()
+        end_id_minus1 = ident.get("EndingIdentifierMinus1", "").strip()
+
+        self.no_of_pages = int(ident.get("NoOfPages", 0))
+        self.occurrence = int(ident.get("Occurence", 1)) or 1
+
+        # In C# code, this is a POSITIVE offset for start, and NEGATIVE for end
+        start_offset = int(ident.get("StartingMinusN", "0").strip() or 0)
+        end_offset = int(ident.get("EndingMinusN", "0").strip() or 0)
+
+        self.first_identifiers: Optional[List[CompiledIdentifier]] = None
+        self.first_offset = 0
+        if start_id_plus1:
+            self.first_identifiers, self.first_offset = _split_identifiers(start_id_plus1), start_offset
+        elif start_id:
+            self.first_identifiers = _split_identifiers(start_id)
+
+        self.last_identifiers: Optional[List[CompiledIdentifier]] = None
+        self.last_offset = 0
+        if end_id_minus1:
+            self.last_identifiers, self.last_offset = _split_identifiers(end_id_minus1), end_offset
+        elif end_id:
+            self.last_identifiers = _split_identifiers(end_id)
+
+class RuleSet:
+    """
+    A message's Identifiers compiled for demarcate_document: rules in Sequence order, and the
+    substring patterns of all of them with their Aho-Corasick automaton. Immutable once built,
+    so one RuleSet is shared by every message carrying the same rules (see compile_rule_set).
+    """
+    __slots__ = ("key", "rules", "patterns", "automaton")
+
+    def __init__(self, identifiers: List[Dict], key: str = ""):
+        self.key = key
+        # Sort by sequence to process in the correct order
+        order = sorted(range(len(identifiers)), key=lambda i: int(identifiers[i].get("Sequence", 999)))
+        self.rules = [CompiledRule(i, identifiers[i]) for i in order]
+        patterns = set()
+        for rule in self.rules:
+            for split_identifiers in (rule.first_identifiers, rule.last_identifiers):
+                patterns.update(identifier.lowered for identifier in split_identifiers or () if not identifier.exact_match)
+        self.patterns = frozenset(patterns)
+        self.automaton = _build_automaton(self.patterns)
+
+    @staticmethod
+    def make_key(identifiers: List[Dict]) -> str:
+        """SHA-256 of the rule-defining fields of the identifiers, in message order."""
+        # Values in RULE_FIELDS order, then the absent fields (they get defaults, unlike fields set to None)
+        rule_fields = [[ident.get(field) for field in RULE_FIELDS] + [[field for field in RULE_FIELDS if field not in ident]]
+                       for ident in identifiers]
+        return hashlib.sha256(json.dumps(rule_fields, ensure_ascii=False, default=repr).encode('utf-8')).hexdigest()
+
+class RuleSetCache:
+    """
+    Bounded in-memory LRU of compiled RuleSets keyed by RuleSet.make_key. Messages from the same
+    client carry the same rules, so they are parsed and their automaton built once per process.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, RuleSet]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[RuleSet]:
+        with self._lock:
+            rule_set = self._entries.get(key)
+            if rule_set is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rule_set
+
+    def put(self, key: str, rule_set: RuleSet) -> None:
+        """Stores a rule set, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = rule_set
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+rule_set_cache = RuleSetCache(settings.RULESET_CACHE_MAX_ENTRIES)
+
+def compile_rule_set(identifiers: List[Dict]) -> RuleSet:
+    """The RuleSet for a message's Identifiers, from rule_set_cache when the same rules were seen before."""
+    key = RuleSet.make_key(identifiers)
+    rule_set = rule_set_cache.get(key)
+    outcome = "hit"
+    if rule_set is None:
+        outcome = "miss"
+        rule_set = RuleSet(identifiers, key)
+        rule_set_cache.put(key, rule_set)
+    stats = rule_set_cache.stats()
+    logger.info(f"📊 Rule set cache {outcome}: {len(rule_set.rules)} rules, hits={stats['hits']} misses={stats['misses']} evictions={stats['evictions']} hit rate={stats['hit_rate']:.1%}")
+    return rule_set
+
+def _count_identifier_hits(pages: PageTextIndex, page_num: int, identifiers: List[CompiledIdentifier]) -> int:
+    """
+    Occurrences of the identifiers on a page; an exact-match identifier counts once if it is the whole page.
+    A page contains an identifier when its lower-cased form is in the lower-cased page. The count is then
+    the one from the page scan when page and identifier are ASCII; otherwise count_occurrences is used,
+    since re.IGNORECASE folds some characters differently from str.lower().
+    """
+    hits = 0
+    for identifier in identifiers:
+        if identifier.exact_match:
+            if pages.lowered(page_num) == identifier.lowered:
+                hits += 1
+            continue
+        count = pages.identifier_count(page_num, identifier.lowered)
+        if count:
+            if identifier.is_ascii and pages.normalized(page_num).isascii():
+                hits += count
+            else:
+                hits += identifier.count_in(pages.normalized(page_num))
+    return hits
+
+def _page_has_identifier(pages: PageTextIndex, page_num: int, identifiers: List[CompiledIdentifier]) -> bool:
+    """True if any identifier is on the page (an exact-match identifier must be the whole page)."""
+    for identifier in identifiers:
+        if identifier.exact_match:
+            if pages.lowered(page_num) == identifier.lowered:
+                return True
+        elif pages.identifier_count(page_num, identifier.lowered):
+            return True
+    return False
+
+def _find_first_page(pages: PageTextIndex, identifiers: List[CompiledIdentifier], occurrence: int, offset: int,
+                     demarcated_ranges: Union[DemarcationSession, List[Tuple[int, int]]]) -> int:
+    """The page (plus offset) where the identifiers reach their occurrence-th hit, skipping demarcated results; -1 if never."""
+    occurrence_counter = 0
+    for page_num in range(len(pages)):
+
+        # C# checks demarcation on the *potential* resulting page
+        potential_page = page_num + 1 + offset
+        if _is_page_demarcated(potential_page, demarcated_ranges):
+            continue
+
+        occurrence_counter += _count_identifier_hits(pages, page_num, identifiers)
+
+        if occurrence_counter >= occurrence:
+            return potential_page # Return page number + offset
+
+    return -1 # Not found
+
+def _find_last_page(pages: PageTextIndex, first_page: int, identifiers: List[CompiledIdentifier], offset: int) -> int:
+    """The first page from first_page on with an identifier, minus offset; -1 if none, or if that falls before first_page."""
+    # Search forward from the start page
+    for page_num in range(first_page - 1, len(pages)):
+        if _page_has_identifier(pages, page_num, identifiers):
+            potential_last_page = (page_num + 1) - offset
+            # C# includes a sanity check
+            if first_page <= potential_last_page:
+                return potential_last_page
+            else:
+                return -1 # Invalid range
+
+    return -1 # Not found
+
+
 # ---------------- REWRITTEN DEMARCATION LOGIC (To match C#) ----------------
 
 def get_first_page(
-    pdf_pages_text: List[str],
+    pdf_pages_text: Union[PageTextIndex, List[str]],
     start_id: str,
     start_id_plus1: str,
     occurrence: int,
     start_offset: int,
-    demarcated_ranges: List[Tuple[int, int]]
+    demarcated_ranges: Union[DemarcationSession, List[Tuple[int, int]]]
 ) -> int:
     """
     Finds the first page based on C# logic.
     - If start_id_plus1 is present, it's the primary search key, and start_offset is ADDED.
     - Otherwise, start_id is the key, and no offset is applied.
     """
-    occurrence_counter = 0
+    pages = _page_text_index(pdf_pages_text)
 
     # Branch 1: Logic for StartingIdentifierPlus1 (alternateIdentifiers in C#)
     if start_id_plus1:
-        plus1_identifiers = [normalize_text(i) for i in start_id_plus1.split('|') if i.strip()]
-        for page_num, page_text in enumerate(pdf_pages_text):
-            
-            # C# checks demarcation on the *potential* resulting page
-            potential_page = page_num + 1 + start_offset
-            if _is_page_demarcated(potential_page, demarcated_ranges):
-                continue
-                
-            normalized_page = normalize_text(page_text)
-            for identifier in plus1_identifiers:
-                if _is_exact_match(identifier):
-                    clean_id = _clean_exact_match_identifier(identifier)
-                    if _is_page_contains_only(normalized_page, clean_id):
-                        occurrence_counter += 1
-                elif identifier.lower() in normalized_page.lower():
-                    occurrence_counter += count_occurrences(normalized_page, identifier)
-            
-            if occurrence_counter >= occurrence:
-                return potential_page # Return page number + offset
+        plus1_identifiers = _split_identifiers(start_id_plus1)
+        pages.add_identifiers(plus1_identifiers)
+        return _find_first_page(pages, plus1_identifiers, occurrence, start_offset, demarcated_ranges)
 
     # Branch 2: Logic for StartingIdentifier (primary identifiers in C#)
     elif start_id:
-        start_identifiers = [normalize_text(i) for i in start_id.split('|') if i.strip()]
-        for page_num, page_text in enumerate(pdf_pages_text):
-
-            if _is_page_demarcated(page_num + 1, demarcated_ranges):
-                continue
-                
-            normalized_page = normalize_text(page_text)
-            for identifier in start_identifiers:
-                if _is_exact_match(identifier):
-                    clean_id = _clean_exact_match_identifier(identifier)
-                    if _is_page_contains_only(normalized_page, clean_id):
-                        occurrence_counter += 1
-                elif identifier.lower() in normalized_page.lower():
-                    occurrence_counter += count_occurrences(normalized_page, identifier)
-            
-            if occurrence_counter >= occurrence:
-                return page_num + 1 # Return 1-based page number
-    
+        start_identifiers = _split_identifiers(start_id)
+        pages.add_identifiers(start_identifiers)
+        return _find_first_page(pages, start_identifiers, occurrence, 0, demarcated_ranges)
+
     return -1 # Not found
 
 def get_last_page(
-    pdf_pages_text: List[str],
+    pdf_pages_text: Union[PageTextIndex, List[str]],
     first_page: int,
     end_id: str,
     end_id_minus1: str,
@@ -389,98 +1592,63 @@ def get_last_page(
     - If only end_id is found, that page number is the end page.
     - If no identifiers, it's the last page of the PDF.
     """
-    total_pages = len(pdf_pages_text)
+    pages = _page_text_index(pdf_pages_text)
 
     # Branch 1: Logic for EndingIdentifierMinus1 (alternateIdentifiers in C#)
     if end_id_minus1:
-        minus1_identifiers = [normalize_text(i) for i in end_id_minus1.split('|') if i.strip()]
-        # Search forward from the start page
-        for page_num in range(first_page - 1, total_pages):
-            normalized_page = normalize_text(pdf_pages_text[page_num])
-            for identifier in minus1_identifiers:
-                found = False
-                if _is_exact_match(identifier):
-                    if _is_page_contains_only(normalized_page, _clean_exact_match_identifier(identifier)):
-                        found = True
-                elif identifier.lower() in normalized_page.lower():
-                    found = True
-                
-                if found:
-                    potential_last_page = (page_num + 1) - end_offset
-                    # C# includes a sanity check
-                    if first_page <= potential_last_page:
-                        return potential_last_page
-                    else:
-                        return -1 # Invalid range
+        minus1_identifiers = _split_identifiers(end_id_minus1)
+        pages.add_identifiers(minus1_identifiers)
+        return _find_last_page(pages, first_page, minus1_identifiers, end_offset)
 
     # Branch 2: Logic for EndingIdentifier (primary identifiers in C#)
     elif end_id:
-        end_identifiers = [normalize_text(i) for i in end_id.split('|') if i.strip()]
-        # Search forward from the start page
-        for page_num in range(first_page - 1, total_pages):
-            normalized_page = normalize_text(pdf_pages_text[page_num])
-            for identifier in end_identifiers:
-                found = False
-                if _is_exact_match(identifier):
-                    if _is_page_contains_only(normalized_page, _clean_exact_match_identifier(identifier)):
-                        found = True
-                elif identifier.lower() in normalized_page.lower():
-                    found = True
-
-                if found:
-                    return page_num + 1
-    
-    # Branch 3: No ending identifier provided
-    else:
-        return total_pages
+        end_identifiers = _split_identifiers(end_id)
+        pages.add_identifiers(end_identifiers)
+        return _find_last_page(pages, first_page, end_identifiers, 0)
 
-    return -1 # Not found
+    # Branch 3: No ending identifier provided
+    return len(pages)
 
-def demarcate_document(pdf_pages_text: List[str], identifiers: List[Dict]) -> List[Dict]:
-    """Processes identifiers to find sub-document page ranges with full C# rules."""
-    demarcated_ranges = []
+def demarcate_document(pdf_pages_text: List[str], identifiers: List[Dict], rule_set: Optional[RuleSet] = None) -> List[Dict]:
+    """
+    Processes identifiers to find sub-document page ranges with full C# rules.
+    rule_set is the compiled form of identifiers; by default it comes from compile_rule_set.
+    """
+    if rule_set is None:
+        rule_set = compile_rule_set(identifiers)
     sub_document_rows = []
     total_pages = len(pdf_pages_text)
+    # Every page is normalized at most once, and scanned once for the identifiers of all rules
+    session = DemarcationSession(pdf_pages_text)
+    pages = session.pages
+    pages.use_rule_set(rule_set)
 
-    # Sort by sequence to process in the correct order
-    for ident in sorted(identifiers, key=lambda x: int(x.get("Sequence", 999))):
-        start_id = ident.get("StartingIdentifier", "").strip()
-        start_id_plus1 = ident.get("StartingIdentifierPlus1", "").strip()
-        end_id = ident.get("EndingIdentifier", "").strip()
-        end_id_minus1 = ident.get("EndingIdentifierMinus1", "").strip()
-        
-        no_of_pages = int(ident.get("NoOfPages", 0))
-        occurrence = int(ident.get("Occurence", 1))
-        if occurrence == 0: occurrence = 1
-        
-        # In C# code, this is a POSITIVE offset for start, and NEGATIVE for end
-        start_offset = int(ident.get("StartingMinusN", "0").strip() or 0)
-        end_offset = int(ident.get("EndingMinusN", "0").strip() or 0)
-        
+    for rule in rule_set.rules:
+        ident = identifiers[rule.index]
         from_page, to_page = 0, 0
         first_page = -1
 
         # C# implies that if no start identifiers are provided, it starts on page 1
-        if not start_id and not start_id_plus1:
+        if rule.first_identifiers is None:
             first_page = 1
         else:
-            first_page = get_first_page(pdf_pages_text, start_id, start_id_plus1, occurrence, start_offset, demarcated_ranges)
+            first_page = _find_first_page(pages, rule.first_identifiers, rule.occurrence, rule.first_offset, session)
 
         if first_page > 0:
             from_page = first_page
-            
+
             # Rule 1: Fixed number of pages has highest priority for end page
-            if no_of_pages > 0:
-                to_page = min(from_page + no_of_pages - 1, total_pages)
+            if rule.no_of_pages > 0:
+                to_page = min(from_page + rule.no_of_pages - 1, total_pages)
+            elif rule.last_identifiers is None:
+                to_page = total_pages
             else:
                 # Rule 2: Find end page using identifiers
-                to_page = get_last_page(pdf_pages_text, from_page, end_id, end_id_minus1, end_offset)
-            
+                to_page = _find_last_page(pages, from_page, rule.last_identifiers, rule.last_offset)
+
             # Final validation and overlap check
             if to_page > 0 and to_page >= from_page:
-                if not _is_range_overlapping((from_page, to_page), demarcated_ranges):
-                    demarcated_ranges.append((from_page, to_page))
-                else:
+                if not session.claim((from_page, to_page)):
                     # If overlap, invalidate this document as per C# logic
                     from_page, to_page = 0, 0
             else:
@@ -506,6 +1674,7 @@ def demarcate_document(pdf_pages_text: List[str], identifiers: List[Dict]) -> Li
 
     return sub_document_rows
 
+
 # ---------------- MAIN PROCESS ----------------
 def process_pdf(pdf_path: str, identifiers: list) -> list[dict]:
     """Full pipeline: OCR + demarcation"""
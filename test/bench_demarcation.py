@@ -0,0 +1,324 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import tracemalloc
+from collections import Counter
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ocr_processor import RuleSet, demarcate_document, get_first_page, get_last_page
+import demarcation_baseline
+import test2
+
+try:
+    import test1  # Needs pytesseract, requests, python-dotenv and azure-storage-queue at import time
+except ImportError as e:
+    test1 = None
+    TEST1_IMPORT_ERROR = str(e)
+
+IDENTIFIER_FIELDS = ("StartingIdentifier", "StartingIdentifierPlus1", "EndingIdentifier", "EndingIdentifierMinus1")
+FILLER_WORDS = ("the", "court", "plaintiff", "defendant", "order", "notice", "property", "county", "filed",
+                "hereby", "judgment", "motion", "said", "party", "dated", "state", "case", "number", "page")
+# Identifiers whose case folds differently under str.lower() and re.IGNORECASE, or that change length when lower-cased
+EDGE_IDENTIFIERS = ("İstanbul", "STRASSE", "straße", "ǅ", "K", "ﬁle", "Ω")
+NUMERIC_FIELDS = ("NoOfPages", "Occurence", "StartingMinusN", "EndingMinusN")
+
+
+def load_sample_rules() -> list:
+    """Identifiers of every test/payload/Input_Sample*.json message."""
+    rules = []
+    for path in sorted(glob.glob(os.path.join(PROJECT_ROOT, "test", "payload", "Input_Sample*.json"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            rules.extend(json.load(f).get("Identifiers", []))
+    return rules
+
+
+def make_rules(sample_rules: list, count: int) -> list:
+    """count rules cycled from the samples, renumbered by Sequence."""
+    return [dict(sample_rules[i % len(sample_rules)], Sequence=str(i + 1)) for i in range(count)]
+
+
+def rule_identifiers(rules: list) -> list:
+    """Every '|'-separated identifier of the rules' identifier fields."""
+    return [identifier.strip() for rule in rules for field in IDENTIFIER_FIELDS
+            for identifier in (rule.get(field) or "").split('|') if identifier.strip()]
+
+
+def make_pages(rules: list, page_count: int, rng: random.Random) -> list:
+    """
+    OCR-like page texts: filler words with the rules' identifiers dropped onto about a
+    third of the pages, in random case and with line breaks in place of some spaces.
+    """
+    identifiers = rule_identifiers(rules)
+    pages = []
+    for _ in range(page_count):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(250, 450))]
+        if identifiers and rng.random() < 0.35:
+            for _ in range(rng.randint(1, 2)):
+                identifier = rng.choice(identifiers)
+                identifier = identifier.upper() if rng.random() < 0.3 else identifier
+                identifier = identifier.replace(" ", "\n", 1) if rng.random() < 0.3 else identifier
+                words.insert(rng.randrange(len(words) + 1), identifier)
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        pages.append("\n".join(lines) + "\n\f")
+    return pages
+
+
+def make_edge_case(sample_rules: list, rng: random.Random):
+    """
+    A short document and rule set for the corners of the rules: ExactMatch: pages, EDGE_IDENTIFIERS,
+    Occurence above 1, StartingMinusN / EndingMinusN offsets (negative too), NoOfPages, repeated
+    Sequence values and blank pages.
+    """
+    identifiers = rule_identifiers(sample_rules) + list(EDGE_IDENTIFIERS)
+
+    def identifier_field() -> str:
+        picks = [rng.choice(identifiers) for _ in range(rng.randint(0, 3))]
+        if picks and rng.random() < 0.2:
+            picks[0] = "ExactMatch: " + picks[0]
+        return "|".join(picks)
+
+    rules = []
+    for i in range(rng.randint(1, 20)):
+        rule = dict(rng.choice(sample_rules))
+        rule.update({
+            "StartingIdentifier": identifier_field(),
+            "StartingIdentifierPlus1": identifier_field() if rng.random() < 0.3 else "",
+            "EndingIdentifier": identifier_field(),
+            "EndingIdentifierMinus1": identifier_field() if rng.random() < 0.3 else "",
+            "NoOfPages": rng.choice([0, 0, 1, 2, 5]),
+            "Occurence": rng.choice([0, 1, 2]),
+            "StartingMinusN": rng.choice([" ", "1", "2", "-1"]),
+            "EndingMinusN": rng.choice([" ", "1", "-1"]),
+            "Sequence": str(rng.randint(1, i + 1)),
+        })
+        rules.append(rule)
+
+    pages = []
+    for _ in range(rng.randint(1, 40)):
+        kind = rng.random()
+        if kind < 0.1:
+            pages.append("")
+        elif kind < 0.2:
+            pages.append(f"\n {rng.choice(identifiers)} \n\f")  # The whole page is one identifier
+        else:
+            words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(5, 60))]
+            for _ in range(rng.randint(0, 3)):
+                identifier = rng.choice(identifiers)
+                identifier = rng.choice([identifier, identifier.upper(), identifier.lower()])
+                words.insert(rng.randrange(len(words) + 1), identifier)
+            pages.append("".join(word + rng.choice((" ", " ", "\n", "\t", "  ")) for word in words))
+    return pages, rules
+
+
+def numeric_rules(rules: list) -> list:
+    """
+    The rules with NoOfPages, Occurence, StartingMinusN and EndingMinusN as ints (blank is 0).
+    test1 and test2 expect numbers there, while the payloads carry strings such as " ".
+    """
+    return [dict(rule, **{field: int(str(rule[field]).strip() or 0) for field in NUMERIC_FIELDS if field in rule}) for rule in rules]
+
+
+def test1_demarcate(pages: list, rules: list) -> list:
+    """The demarcation loop of test/test1.py ProcessPDFOCR on page texts: the rows it would queue, without OCR or queues."""
+    total_pages = len(pages)
+    demarcated_ranges = []
+    rows = []
+    for identifier in rules:
+        first_page = test1.GetFirstPageFromIdentifiers(
+            pages,
+            identifier.get("StartingIdentifier", ""),
+            identifier.get("StartingIdentifierPlus1", ""),
+            int(identifier.get("Occurence", 1)),
+            int(identifier.get("StartingMinusN", 0)),
+            demarcated_ranges,
+            total_pages
+        )
+        last_page = test1.GetLastPageFromIdentifiers(
+            pages,
+            identifier.get("EndingIdentifier", ""),
+            identifier.get("EndingIdentifierMinus1", ""),
+            first_page,
+            int(identifier.get("NoOfPages", 0)),
+            int(identifier.get("StartingMinusN", 0)),
+            demarcated_ranges,
+            total_pages
+        )
+        if not test1.IsPageRangeOverlapping(first_page, last_page, demarcated_ranges):
+            demarcated_ranges.append((first_page, last_page))
+            rows.append({
+                "DocumentTypeID": identifier.get("DocumentTypeID"),
+                "DocumentTypeName": identifier.get("DocumentTypeName"),
+                "FromPageNumber": first_page,
+                "ToPageNumber": last_page
+            })
+    return rows
+
+
+IMPLEMENTATIONS = {
+    "current": demarcate_document,  # Rule set cache warm after the first run
+    "current-cold": lambda pages, rules: demarcate_document(pages, rules, RuleSet(rules)),  # Rules compiled every run
+    "baseline": demarcation_baseline.demarcate_document,
+    "test2": lambda pages, rules: test2.process_demarcation(pages, numeric_rules(rules)),
+    "test1": lambda pages, rules: test1_demarcate(pages, numeric_rules(rules)),
+}
+
+
+class LogCapture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def run_logged(demarcate, logger_name: str, pages: list, rules: list):
+    """
+    (rows serialized to UTF-8 JSON bytes, result and overlap lines logged by logger_name) of one call,
+    or the exception it raised. 📊 stats lines are left out: the baseline has no rule set cache.
+    """
+    logger = logging.getLogger(logger_name)
+    capture = LogCapture()
+    level, propagate = logger.level, logger.propagate
+    logger.addHandler(capture)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        rows = demarcate(pages, rules)
+        outcome = json.dumps(rows, ensure_ascii=False).encode('utf-8')
+    except Exception as e:
+        outcome = f"{type(e).__name__}: {e}"
+    finally:
+        logger.removeHandler(capture)
+        logger.setLevel(level)
+        logger.propagate = propagate
+    return outcome, [message for message in capture.messages if not message.startswith("📊")]
+
+
+def _without_automaton(rule_set: RuleSet) -> RuleSet:
+    """The rule set as compiled without pyahocorasick: identifiers are counted with str.count."""
+    rule_set.automaton = None
+    return rule_set
+
+
+def check_equivalence(sample_rules: list, cases: int, seed: int) -> list:
+    """
+    Runs the optimized demarcation paths against demarcation_baseline on cases randomized documents,
+    alternating sample-rule corpora with make_edge_case ones. Returns a description of each mismatch.
+    """
+    no_automaton = lambda pages, rules: demarcate_document(pages, rules, _without_automaton(RuleSet(rules)))
+    paths = (("rule set cache", demarcate_document), ("rule set cache (again)", demarcate_document),
+             ("str.count fallback", no_automaton))
+    failures = []
+    for case in range(cases):
+        rng = random.Random(seed * 100003 + case)
+        if case % 2:
+            pages, rules = make_edge_case(sample_rules, rng)
+        else:
+            rules = make_rules(sample_rules, rng.randint(1, 60))
+            pages = make_pages(rules, rng.randint(1, 80), rng)
+
+        expected = run_logged(demarcation_baseline.demarcate_document, demarcation_baseline.__name__, pages, rules)
+        for name, demarcate in paths:
+            if run_logged(demarcate, "ocr_processor", pages, rules) != expected:
+                failures.append(f"case {case}: {name} differs from the baseline ({len(pages)} pages, {len(rules)} rules)")
+
+        if case % 2:
+            # The string helpers, on every rule with no pages claimed yet
+            for rule in rules:
+                start_offset = int(rule["StartingMinusN"].strip() or 0)
+                end_offset = int(rule["EndingMinusN"].strip() or 0)
+                args = (rule["StartingIdentifier"].strip(), rule["StartingIdentifierPlus1"].strip(), int(rule["Occurence"]) or 1, start_offset, [])
+                if get_first_page(pages, *args) != demarcation_baseline.get_first_page(pages, *args):
+                    failures.append(f"case {case}: get_first_page differs for Sequence {rule['Sequence']}")
+                args = (1, rule["EndingIdentifier"].strip(), rule["EndingIdentifierMinus1"].strip(), end_offset)
+                if get_last_page(pages, *args) != demarcation_baseline.get_last_page(pages, *args):
+                    failures.append(f"case {case}: get_last_page differs for Sequence {rule['Sequence']}")
+    return failures
+
+
+def found_ranges(rows: list) -> Counter:
+    """(document type, from page, to page) of the demarcated rows, whichever implementation's row keys they use."""
+    ranges = Counter()
+    for row in rows:
+        from_page = row.get("FromPageNumber", row.get("FromPage", 0))
+        if from_page > 0:
+            ranges[(row.get("DocumentTypeId", row.get("DocumentTypeID")), from_page, row.get("ToPageNumber", row.get("ToPage")))] += 1
+    return ranges
+
+
+def measure(demarcate, pages: list, rules: list, repeats: int):
+    """Mean milliseconds per call, its peak traced allocation in KiB, and the rows of the last call."""
+    rows = demarcate(pages, rules)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        rows = demarcate(pages, rules)
+    mean_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    tracemalloc.start()
+    demarcate(pages, rules)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mean_ms, peak / 1024, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check demarcation against the frozen baseline and time the demarcation implementations "
+                                                 "on synthetic page texts with the sample payload rules. No OCR is involved.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 500], help="Page counts (default: 100 500)")
+    parser.add_argument("--rules", type=int, nargs="+", default=[13, 50], help="Rule counts (default: 13 50)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per combination (default: 3)")
+    parser.add_argument("--seed", type=int, default=1, help="Corpus seed (default: 1)")
+    parser.add_argument("--check", type=int, default=200, help="Randomized equivalence cases before timing; 0 skips the check (default: 200)")
+    parser.add_argument("--implementations", nargs="+", choices=list(IMPLEMENTATIONS), default=list(IMPLEMENTATIONS),
+                        help="Implementations to time (default: all)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)  # Per-rule results and overlap warnings
+    sample_rules = load_sample_rules()
+
+    if args.check > 0:
+        failures = check_equivalence(sample_rules, args.check, args.seed)
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            print(f"❌ {len(failures)} mismatches against the baseline in {args.check} cases")
+            sys.exit(1)
+        print(f"✅ Rows and logged results identical to the baseline in {args.check} cases")
+
+    implementations = [name for name in args.implementations if name != "test1" or test1 is not None]
+    if len(implementations) < len(args.implementations):
+        print(f"⚠️ test1 skipped: {TEST1_IMPORT_ERROR}")
+
+    print(f"\n📊 Demarcation, {len(sample_rules)} sample rules, {args.repeats} runs per combination; "
+          f"'same' counts the baseline's demarcated ranges an implementation also finds")
+    print(f"{'pages':>6}{'rules':>7}  {'implementation':<15}{'mean ms':>10}{'docs/sec':>10}{'peak KiB':>10}{'found':>7}{'same':>7}")
+    for page_count in args.pages:
+        for rule_count in args.rules:
+            rules = make_rules(sample_rules, rule_count)
+            pages = make_pages(rules, page_count, random.Random(args.seed))
+            baseline_ranges = found_ranges(demarcation_baseline.demarcate_document(pages, rules))
+            for name in implementations:
+                try:
+                    mean_ms, peak_kib, rows = measure(IMPLEMENTATIONS[name], pages, rules, args.repeats)
+                except Exception as e:
+                    print(f"{page_count:>6}{rule_count:>7}  {name:<15}fails on these rules: {type(e).__name__}: {e}")
+                    continue
+                ranges = found_ranges(rows)
+                same = sum((ranges & baseline_ranges).values())
+                print(f"{page_count:>6}{rule_count:>7}  {name:<15}{mean_ms:>10.1f}{1000 / mean_ms:>10.2f}{peak_kib:>10.0f}"
+                      f"{sum(ranges.values()):>7}{same:>7}")
+
+
+if __name__ == "__main__":
+    main()
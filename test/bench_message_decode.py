@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from data_models import MessageEnvelope
+
+
+def make_message(pdf_bytes: int) -> str:
+    """A base64-encoded queue message carrying pdf_bytes of (random) embedded PDF content."""
+    fields = {
+        "UploadDatasheetid": "bench",
+        "ClientFileName": "bench.pdf",
+        "DocReceivedId": 1,
+        "BatchId": 1,
+        "Identifiers": [{"Identifier": "INVOICE", "Sequence": 1}],
+        "PdfContent": base64.b64encode(os.urandom(pdf_bytes)).decode('ascii'),
+    }
+    return base64.b64encode(json.dumps(fields).encode('utf-8')).decode('ascii')
+
+
+def decode_per_stage(content: str, payload_path: str):
+    """The previous flow: decoded for the receive artifacts, again for processing, payload re-serialized."""
+    json.loads(base64.b64decode(content).decode('utf-8'))  # AzureQueueService.receive_messages
+    message_content = json.loads(base64.b64decode(content).decode('utf-8'))  # main.decode_message_content
+    with open(payload_path, 'w', encoding='utf-8') as f:
+        json.dump(message_content, f, ensure_ascii=False, indent=2)  # main.save_payload
+    pdf_data = base64.b64decode(message_content["PdfContent"])
+    return message_content, pdf_data  # Held until the message is done
+
+
+def decode_envelope(content: str, payload_path: str):
+    """The envelope flow: decoded once at receive time, payload written as received, PDF decoded on use."""
+    envelope = MessageEnvelope.decode(content)
+    envelope.write_payload(payload_path)
+    return envelope, envelope.pdf_bytes()
+
+
+def measure(decode, content: str, payload_path: str, repeats: int):
+    """
+    Mean milliseconds per message, plus the peak traced allocation while decoding one message
+    and what stays allocated afterwards (held through OCR), both in MiB.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        decode(content, payload_path)
+    mean_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    tracemalloc.start()
+    retained = decode(content, payload_path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+    return mean_ms, peak / (1024 * 1024), current / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-message decode cost and peak memory for messages with an embedded PDF.")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 8, 32], help="Embedded PDF sizes in MiB (default: 1 8 32)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed decodes per size and variant (default: 5)")
+    args = parser.parse_args()
+
+    payload_path = os.path.join(PROJECT_ROOT, "test", "bench_payload.json")
+    print(f"\n📊 Message decode, {args.repeats} runs per size")
+    print(f"{'PDF MiB':>8}  {'variant':<18}{'mean ms':>10}{'peak MiB':>10}{'held MiB':>10}")
+    try:
+        for size_mb in args.sizes_mb:
+            content = make_message(int(size_mb * 1024 * 1024))
+            for name, decode in (("decode per stage", decode_per_stage), ("envelope", decode_envelope)):
+                mean_ms, peak_mb, held_mb = measure(decode, content, payload_path, args.repeats)
+                print(f"{size_mb:>8g}  {name:<18}{mean_ms:>10.1f}{peak_mb:>10.1f}{held_mb:>10.1f}")
+    finally:
+        if os.path.exists(payload_path):
+            os.remove(payload_path)
+
+
+if __name__ == "__main__":
+    main()
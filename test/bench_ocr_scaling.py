@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import argparse
+import logging
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ocr_processor import get_text_from_pdf, shutdown_page_pools, OCR_EXECUTOR_PROCESS, OCR_EXECUTOR_THREAD
+
+
+def measure(pdf_path: str, mode: str, workers: int, engine: str = None) -> float:
+    """
+    Runs a full OCR pass and returns pages/sec (0 if nothing was extracted).
+    Includes starting the page pool, which is shut down afterwards so idle workers don't pile up across configurations.
+    """
+    start = time.perf_counter()
+    pages = get_text_from_pdf(pdf_path, executor_mode=mode, max_workers=workers, engine_name=engine)
+    elapsed = time.perf_counter() - start
+    shutdown_page_pools()
+    return len(pages) / elapsed if pages and elapsed > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure OCR pages/sec for the process and thread executors.")
+    parser.add_argument("pdf", help="PDF file to OCR")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="Comma-separated worker counts (default: 1,2,4,8,16)")
+    parser.add_argument("--modes", default=f"{OCR_EXECUTOR_PROCESS},{OCR_EXECUTOR_THREAD}", help="Comma-separated executor modes")
+    parser.add_argument("--engine", default=None, help="OCR engine to use (default: Settings.OCR_ENGINE)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    worker_counts = [int(w) for w in args.workers.split(',') if w.strip()]
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+
+    print(f"\n📊 OCR scaling for {os.path.basename(args.pdf)}")
+    print(f"{'mode':<10}{'workers':>8}{'pages/sec':>12}")
+    for mode in modes:
+        for workers in worker_counts:
+            print(f"{mode:<10}{workers:>8}{measure(args.pdf, mode, workers, args.engine):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ocr_processor import _pixmap_to_image, _render_page
+
+
+def png_round_trip(page: fitz.Page, dpi: int) -> None:
+    """The previous handoff: RGB render -> PNG bytes -> decoded PIL image."""
+    pix = page.get_pixmap(dpi=dpi)
+    img = Image.open(BytesIO(pix.tobytes("png")))
+    img.load()
+
+
+def raw_handoff(page: fitz.Page, dpi: int, grayscale: bool) -> None:
+    """The current handoff: PIL image copied straight from the pixmap samples."""
+    pix = _render_page(page, dpi, grayscale)
+    img = _pixmap_to_image(pix)
+    del pix
+    img.load()
+
+
+def time_per_page(fn, pages, repeats: int) -> float:
+    """Average milliseconds per page for fn(page)."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for page in pages:
+            fn(page)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(pages))
+
+
+def synthetic_pdf() -> fitz.Document:
+    """A small text-heavy document, used when no PDF is given."""
+    doc = fitz.open()
+    for n in range(3):
+        page = doc.new_page()
+        for line in range(50):
+            page.insert_text((40, 40 + line * 14), f"Page {n + 1} line {line + 1}: IT IS THEREFORE ORDERED, ADJUDGED AND DECREED")
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PNG round-trip with the raw pixmap handoff per page.")
+    parser.add_argument("pdf", nargs="?", help="PDF to render (a synthetic 3-page document is used if omitted)")
+    parser.add_argument("--pages", type=int, default=3, help="Number of leading pages to render (default: 3)")
+    parser.add_argument("--repeats", type=int, default=3, help="Repetitions per measurement (default: 3)")
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf) if args.pdf else synthetic_pdf()
+    pages = [doc.load_page(n) for n in range(min(args.pages, doc.page_count))]
+
+    print(f"\n📊 Pixmap handoff, ms/page over {len(pages)} pages x {args.repeats} repeats")
+    # handoff saved: png rgb - raw rgb (same pixels, no PNG round-trip); gray saved: raw rgb - raw gray
+    print(f"{'dpi':>5}{'png rgb':>12}{'raw rgb':>12}{'raw gray':>12}{'handoff saved':>16}{'gray saved':>13}")
+    for dpi in (150, 200, 300):
+        png_ms = time_per_page(lambda p: png_round_trip(p, dpi), pages, args.repeats)
+        rgb_ms = time_per_page(lambda p: raw_handoff(p, dpi, False), pages, args.repeats)
+        gray_ms = time_per_page(lambda p: raw_handoff(p, dpi, True), pages, args.repeats)
+        print(f"{dpi:>5}{png_ms:>12.1f}{rgb_ms:>12.1f}{gray_ms:>12.1f}{png_ms - rgb_ms:>16.1f}{rgb_ms - gray_ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from azure.storage.queue import QueueClient
+from azure_service import QueueClientPool
+
+# Well-known Azurite development account key (not a secret)
+DEV_ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+
+PUT_MESSAGE_RESPONSE = (
+    '<?xml version="1.0" encoding="utf-8"?><QueueMessagesList><QueueMessage>'
+    '<MessageId>00000000-0000-0000-0000-000000000000</MessageId>'
+    '<InsertionTime>Mon, 01 Jan 2024 00:00:00 GMT</InsertionTime>'
+    '<ExpirationTime>Mon, 08 Jan 2024 00:00:00 GMT</ExpirationTime>'
+    '<PopReceipt>AgAAAAMAAAAAAAAA</PopReceipt>'
+    '<TimeNextVisible>Mon, 01 Jan 2024 00:00:00 GMT</TimeNextVisible>'
+    '</QueueMessage></QueueMessagesList>'
+).encode('utf-8')
+
+
+class QueueStandInHandler(BaseHTTPRequestHandler):
+    """Answers Put Message like Azure Queue Storage; new connections pay a simulated TLS handshake."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # Headers and body are separate writes; avoid delayed-ACK stalls on reused connections
+    handshake_seconds = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with QueueStandInHandler.lock:
+            QueueStandInHandler.connections += 1
+        time.sleep(self.handshake_seconds)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(PUT_MESSAGE_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(PUT_MESSAGE_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def time_sends(send_once, count: int):
+    """Per-send latencies in milliseconds and the connections opened meanwhile."""
+    connections_before = QueueStandInHandler.connections
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        send_once()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, QueueStandInHandler.connections - connections_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a new QueueClient per send with the pooled clients, against a local queue stand-in.")
+    parser.add_argument("--sends", type=int, default=200, help="Messages sent per variant (default: 200)")
+    parser.add_argument("--handshake-ms", type=float, default=20.0, help="Simulated TLS handshake per new connection (default: 20)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    QueueStandInHandler.handshake_seconds = args.handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QueueStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn_str = (f"DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey={DEV_ACCOUNT_KEY};"
+                f"QueueEndpoint=http://127.0.0.1:{server.server_port}/devstoreaccount1;")
+    message = '{"UploadDatasheetid": "bench", "SubDocumentDetails": []}'
+
+    def new_client_per_send():
+        QueueClient.from_connection_string(conn_str, "classification").send_message(message)
+
+    pool = QueueClientPool(pool_maxsize=4)
+    pool.get(conn_str, "classification").send_message(message)  # Warm-up: create the client and its connection
+
+    def pooled_send():
+        pool.get(conn_str, "classification").send_message(message)
+
+    print(f"\n📊 send_message latency, {args.sends} sends, {args.handshake_ms:.0f} ms simulated handshake")
+    print(f"{'variant':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'connections':>13}")
+    for name, send_once in (("new client per send", new_client_per_send), ("pooled client", pooled_send)):
+        latencies, connections = time_sends(send_once, args.sends)
+        mean = sum(latencies) / len(latencies)
+        print(f"{name:<22}{mean:>10.2f}{percentile(latencies, 0.5):>10.2f}{percentile(latencies, 0.95):>10.2f}{connections:>13}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+# Well-known Azurite development account (not a secret)
+DEV_ACCOUNT_NAME = "devstoreaccount1"
+DEV_ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+
+
+class BlobStandInHandler(BaseHTTPRequestHandler):
+    """
+    Answers Get Blob / Get Blob Properties like Azure Blob Storage (or Azurite) for files under
+    root_dir/<container>/<blob name>, honouring x-ms-range / Range. Enough for the claim-check
+    download path; authentication headers are accepted without being checked.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    root_dir = "."
+    requests_served = 0
+    lock = threading.Lock()
+
+    def _blob_path(self) -> str:
+        parts = unquote(urlparse(self.path).path).lstrip("/").split("/", 2)
+        if len(parts) < 3 or parts[0] != DEV_ACCOUNT_NAME:
+            return ""
+        path = os.path.normpath(os.path.join(self.root_dir, parts[1], parts[2]))
+        return path if path.startswith(os.path.abspath(self.root_dir)) else ""
+
+    def _send_not_found(self):
+        body = b'<?xml version="1.0" encoding="utf-8"?><Error><Code>BlobNotFound</Code><Message>The specified blob does not exist.</Message></Error>'
+        self.send_response(404)
+        self.send_header("x-ms-error-code", "BlobNotFound")
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        with BlobStandInHandler.lock:
+            BlobStandInHandler.requests_served += 1
+        path = self._blob_path()
+        if not path or not os.path.isfile(path):
+            self._send_not_found()
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get("x-ms-range") or self.headers.get("Range")
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        mtime = os.path.getmtime(path)
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"0x{int(mtime * 1000):X}"')
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.send_header("x-ms-blob-type", "BlockBlob")
+        self.send_header("x-ms-version", self.headers.get("x-ms-version", "2021-08-06"))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, 256 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_blob_standin(root_dir: str, port: int = 0) -> ThreadingHTTPServer:
+    """Serves root_dir on 127.0.0.1 in a daemon thread; see connection_string()."""
+    BlobStandInHandler.root_dir = os.path.abspath(root_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", port), BlobStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def connection_string(server: ThreadingHTTPServer) -> str:
+    return (f"DefaultEndpointsProtocol=http;AccountName={DEV_ACCOUNT_NAME};AccountKey={DEV_ACCOUNT_KEY};"
+            f"BlobEndpoint=http://127.0.0.1:{server.server_port}/{DEV_ACCOUNT_NAME};")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve <root>/<container>/<blob> as a local Blob Storage stand-in for claim-check messages.")
+    parser.add_argument("root", help="Directory whose subfolders are the containers")
+    parser.add_argument("--port", type=int, default=10000, help="Port (default: 10000, as Azurite)")
+    args = parser.parse_args()
+
+    server = start_blob_standin(args.root, args.port)
+    print(f"Serving {BlobStandInHandler.root_dir} as Blob Storage. Set:")
+    print(f'BLOB_CONNECTION_STRING="{connection_string(server)}"')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import logging
+import argparse
+import re
+
+import fitz  # PyMuPDF
+
+# --- Ensure project root is on sys.path ---
+# The repository root is the parent directory of this `test/` folder
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config import settings
+from ocr_processor import OCR_EXECUTOR_THREAD, _fingerprint_pages, extract_pages_from_pdf
+
+BODY_TEXT = ("NOTICE OF FILING. Plaintiff hereby gives notice that the attached exhibits were filed "
+             "with the clerk of the court on the date shown below.")
+
+
+def add_body_page(doc: fitz.Document) -> fitz.Page:
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 540, 200), BODY_TEXT, fontsize=11)
+    return page
+
+
+def add_text_field(page: fitz.Page, name: str, value: str) -> None:
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = name
+    widget.field_value = value
+    widget.rect = fitz.Rect(72, 220, 300, 240)
+    page.add_widget(widget)
+
+
+def add_swapped_image_pages(doc: fitz.Document) -> None:
+    """
+    Two pages drawing two different images through one shared content stream, with the
+    /XObject names bound the other way round on the second page: same streams, different rendering.
+    """
+    page = add_body_page(doc)
+    for n, rect in enumerate((fitz.Rect(72, 220, 172, 320), fitz.Rect(300, 220, 400, 270))):
+        image = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 40 + 20 * n, 40))
+        image.clear_with(60 + 120 * n)
+        page.insert_image(rect, pixmap=image)
+    xref = page.xref  # Page objects don't survive new_page
+    kind, resources = doc.xref_get_key(xref, "Resources")
+    if kind == "xref":
+        resources = doc.xref_object(int(resources.split()[0]), compressed=True)
+    (first_name, first_ref), (second_name, second_ref) = re.findall(r"/(\w+) (\d+ 0 R)", doc.xref_get_key(xref, "Resources/XObject")[1])
+    twin = doc.new_page()
+    doc.xref_set_key(twin.xref, "Contents", doc.xref_get_key(xref, "Contents")[1])
+    doc.xref_set_key(twin.xref, "Resources", resources)
+    doc.xref_set_key(twin.xref, "Resources/XObject", f"<</{first_name} {second_ref}/{second_name} {first_ref}>>")
+
+
+def make_document() -> bytes:
+    """
+    Pages whose content streams are identical, but whose text or rendering differs through a
+    filled form field, a FreeText stamp or the names their images are bound to, plus one truly
+    repeated page:
+    1, 2: the same page twice (should dedup); 3, 4: form field filled with different values;
+    5: page 1 with a "RECEIVED" stamp; 6, 7: the same content stream with its two images swapped.
+    """
+    doc = fitz.open()
+    add_body_page(doc)
+    add_body_page(doc)
+    add_text_field(add_body_page(doc), "plaintiff_name", "Alice Example")
+    add_text_field(add_body_page(doc), "plaintiff_name_2", "Bob Example")
+    add_body_page(doc).add_freetext_annot(fitz.Rect(72, 260, 300, 300), "RECEIVED JAN 05 2024")
+    add_swapped_image_pages(doc)
+    return doc.tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that page fingerprints (page dedup) tell apart pages that differ only in form fields or stamps.")
+    parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    settings.OCR_CACHE_ENABLED = False
+    settings.PAGE_DEDUP_ENABLED = True
+    settings.TEXT_LAYER_ENABLED = True
+    pdf_bytes = make_document()
+
+    failures = []
+    _, fingerprints = _fingerprint_pages(pdf_bytes)
+    if fingerprints[0] != fingerprints[1]:
+        failures.append("identical pages 1 and 2 got different fingerprints")
+    for a, b, what in ((2, 3, "filled form fields"), (0, 4, "a stamp"), (5, 6, "swapped image bindings")):
+        if fingerprints[a] == fingerprints[b]:
+            failures.append(f"pages {a + 1} and {b + 1} differ only in {what} but share a fingerprint")
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        expected = [page.get_text() for page in doc]
+        rendered = [doc.load_page(n).get_pixmap(dpi=36).samples for n in (5, 6)]
+    if rendered[0] == rendered[1]:
+        failures.append("pages 6 and 7 were meant to render differently")
+    pages = extract_pages_from_pdf(pdf_bytes, executor_mode=OCR_EXECUTOR_THREAD, max_workers=2)
+    for page, text in zip(pages, expected):
+        if page["text"] != text:
+            failures.append(f"page {page['page']} came back with another page's text ({page['source']})")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"✅ {len(pages)} pages: form-filled, stamped and rebound pages fingerprinted apart, repeated page deduplicated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# Frozen copy of the demarcation logic in ocr_processor.py as it was before the demarcation
+# speed-ups (page index, identifier automaton, demarcation session, compiled rule sets).
+# test/bench_demarcation.py checks that the current demarcate_document returns byte-identical
+# rows and logs the same results. Keep this file as it is: fix behaviour here only together
+# with the same fix in ocr_processor.py.
+import re
+import logging
+from typing import List, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Replaces all whitespace sequences with a single space."""
+    return re.sub(r"\s+", " ", text).strip()
+
+def _is_exact_match(identifier: str) -> bool:
+    """Helper to check for 'ExactMatch:' prefix, like C#'s IsContainsOnly."""
+    return identifier.strip().lower().startswith("exactmatch:")
+
+def _clean_exact_match_identifier(identifier: str) -> str:
+    """Helper to remove 'ExactMatch:' prefix."""
+    return re.sub(r"^ExactMatch:", "", identifier.strip(), flags=re.IGNORECASE).strip()
+
+def _is_page_contains_only(page_text: str, identifier: str) -> bool:
+    """Checks if the normalized page text is an exact match to the identifier."""
+    return page_text.lower() == identifier.lower()
+
+def count_occurrences(page_text: str, identifier: str) -> int:
+    """Counts non-overlapping occurrences of an identifier in text, case-insensitive."""
+    if not page_text or not identifier:
+        return 0
+    return len(re.findall(re.escape(identifier), page_text, re.IGNORECASE))
+
+def _is_page_demarcated(page_num: int, demarcated_ranges: List[Tuple[int, int]]) -> bool:
+    """Checks if a page falls within any already identified document range."""
+    return any(start <= page_num <= end for start, end in demarcated_ranges)
+
+def _is_range_overlapping(new_range: Tuple[int, int], demarcated_ranges: List[Tuple[int, int]]) -> bool:
+    """
+    Checks if the new page range overlaps with any existing demarcated ranges.
+    This is the direct Python equivalent of the C# IsPageRangeOverlapping logic.
+    """
+    new_start, new_end = new_range
+    # A zero-page range cannot overlap
+    if new_start == 0 or new_end == 0:
+        return False
+        
+    for start, end in demarcated_ranges:
+        # Classic interval overlap check
+        if new_start <= end and new_end >= start:
+            logger.warning(f"Overlap detected for range {new_range}. It overlaps with existing range {(start, end)}.")
+            return True
+    return False
+
+
+# ---------------- REWRITTEN DEMARCATION LOGIC (To match C#) ----------------
+
+def get_first_page(
+    pdf_pages_text: List[str],
+    start_id: str,
+    start_id_plus1: str,
+    occurrence: int,
+    start_offset: int,
+    demarcated_ranges: List[Tuple[int, int]]
+) -> int:
+    """
+    Finds the first page based on C# logic.
+    - If start_id_plus1 is present, it's the primary search key, and start_offset is ADDED.
+    - Otherwise, start_id is the key, and no offset is applied.
+    """
+    occurrence_counter = 0
+
+    # Branch 1: Logic for StartingIdentifierPlus1 (alternateIdentifiers in C#)
+    if start_id_plus1:
+        plus1_identifiers = [normalize_text(i) for i in start_id_plus1.split('|') if i.strip()]
+        for page_num, page_text in enumerate(pdf_pages_text):
+            
+            # C# checks demarcation on the *potential* resulting page
+            potential_page = page_num + 1 + start_offset
+            if _is_page_demarcated(potential_page, demarcated_ranges):
+                continue
+                
+            normalized_page = normalize_text(page_text)
+            for identifier in plus1_identifiers:
+                if _is_exact_match(identifier):
+                    clean_id = _clean_exact_match_identifier(identifier)
+                    if _is_page_contains_only(normalized_page, clean_id):
+                        occurrence_counter += 1
+                elif identifier.lower() in normalized_page.lower():
+                    occurrence_counter += count_occurrences(normalized_page, identifier)
+            
+            if occurrence_counter >= occurrence:
+                return potential_page # Return page number + offset
+
+    # Branch 2: Logic for StartingIdentifier (primary identifiers in C#)
+    elif start_id:
+        start_identifiers = [normalize_text(i) for i in start_id.split('|') if i.strip()]
+        for page_num, page_text in enumerate(pdf_pages_text):
+
+            if _is_page_demarcated(page_num + 1, demarcated_ranges):
+                continue
+                
+            normalized_page = normalize_text(page_text)
+            for identifier in start_identifiers:
+                if _is_exact_match(identifier):
+                    clean_id = _clean_exact_match_identifier(identifier)
+                    if _is_page_contains_only(normalized_page, clean_id):
+                        occurrence_counter += 1
+                elif identifier.lower() in normalized_page.lower():
+                    occurrence_counter += count_occurrences(normalized_page, identifier)
+            
+            if occurrence_counter >= occurrence:
+                return page_num + 1 # Return 1-based page number
+    
+    return -1 # Not found
+
+def get_last_page(
+    pdf_pages_text: List[str],
+    first_page: int,
+    end_id: str,
+    end_id_minus1: str,
+    end_offset: int
+) -> int:
+    """
+    Finds the last page based on C# logic.
+    - Searches FORWARD from first_page.
+    - If end_id_minus1 is found, end_offset is SUBTRACTED from that page number.
+    - If only end_id is found, that page number is the end page.
+    - If no identifiers, it's the last page of the PDF.
+    """
+    total_pages = len(pdf_pages_text)
+
+    # Branch 1: Logic for EndingIdentifierMinus1 (alternateIdentifiers in C#)
+    if end_id_minus1:
+        minus1_identifiers = [normalize_text(i) for i in end_id_minus1.split('|') if i.strip()]
+        # Search forward from the start page
+        for page_num in range(first_page - 1, total_pages):
+            normalized_page = normalize_text(pdf_pages_text[page_num])
+            for identifier in minus1_identifiers:
+                found = False
+                if _is_exact_match(identifier):
+                    if _is_page_contains_only(normalized_page, _clean_exact_match_identifier(identifier)):
+                        found = True
+                elif identifier.lower() in normalized_page.lower():
+                    found = True
+                
+                if found:
+                    potential_last_page = (page_num + 1) - end_offset
+                    # C# includes a sanity check
+                    if first_page <= potential_last_page:
+                        return potential_last_page
+                    else:
+                        return -1 # Invalid range
+
+    # Branch 2: Logic for EndingIdentifier (primary identifiers in C#)
+    elif end_id:
+        end_identifiers = [normalize_text(i) for i in end_id.split('|') if i.strip()]
+        # Search forward from the start page
+        for page_num in range(first_page - 1, total_pages):
+            normalized_page = normalize_text(pdf_pages_text[page_num])
+            for identifier in end_identifiers:
+                found = False
+                if _is_exact_match(identifier):
+                    if _is_page_contains_only(normalized_page, _clean_exact_match_identifier(identifier)):
+                        found = True
+                elif identifier.lower() in normalized_page.lower():
+                    found = True
+
+                if found:
+                    return page_num + 1
+    
+    # Branch 3: No ending identifier provided
+    else:
+        return total_pages
+
+    return -1 # Not found
+
+def demarcate_document(pdf_pages_text: List[str], identifiers: List[Dict]) -> List[Dict]:
+    """Processes identifiers to find sub-document page ranges with full C# rules."""
+    demarcated_ranges = []
+    sub_document_rows = []
+    total_pages = len(pdf_pages_text)
+
+    # Sort by sequence to process in the correct order
+    for ident in sorted(identifiers, key=lambda x: int(x.get("Sequence", 999))):
+        start_id = ident.get("StartingIdentifier", "").strip()
+        start_id_plus1 = ident.get("StartingIdentifierPlus1", "").strip()
+        end_id = ident.get("EndingIdentifier", "").strip()
+        end_id_minus1 = ident.get("EndingIdentifierMinus1", "").strip()
+        
+        no_of_pages = int(ident.get("NoOfPages", 0))
+        occurrence = int(ident.get("Occurence", 1))
+        if occurrence == 0: occurrence = 1
+        
+        # In C# code, this is a POSITIVE offset for start, and NEGATIVE for end
+        start_offset = int(ident.get("StartingMinusN", "0").strip() or 0)
+        end_offset = int(ident.get("EndingMinusN", "0").strip() or 0)
+        
+        from_page, to_page = 0, 0
+        first_page = -1
+
+        # C# implies that if no start identifiers are provided, it starts on page 1
+        if not start_id and not start_id_plus1:
+            first_page = 1
+        else:
+            first_page = get_first_page(pdf_pages_text, start_id, start_id_plus1, occurrence, start_offset, demarcated_ranges)
+
+        if first_page > 0:
+            from_page = first_page
+            
+            # Rule 1: Fixed number of pages has highest priority for end page
+            if no_of_pages > 0:
+                to_page = min(from_page + no_of_pages - 1, total_pages)
+            else:
+                # Rule 2: Find end page using identifiers
+                to_page = get_last_page(pdf_pages_text, from_page, end_id, end_id_minus1, end_offset)
+            
+            # Final validation and overlap check
+            if to_page > 0 and to_page >= from_page:
+                if not _is_range_overlapping((from_page, to_page), demarcated_ranges):
+                    demarcated_ranges.append((from_page, to_page))
+                else:
+                    # If overlap, invalidate this document as per C# logic
+                    from_page, to_page = 0, 0
+            else:
+                # If last page wasn't found or created invalid range
+                from_page, to_page = 0, 0
+
+        # Build sub-document row, even if unsuccessful (pages will be 0)
+        sub_doc_row = {
+            "DocReceivedId": ident.get("DocReceivedId"),
+            "FromPageNumber": from_page,
+            "ToPageNumber": to_page,
+            "FileNumber": ident.get("FirmFile"),
+            "DocumentTypeId": ident.get("DocumentTypeID"),
+            "UploadDataSheetId": ident.get("UploadDatasheetid"),
+            "TotalNumberOfpages": total_pages,
+            "NoOfPages": to_page - from_page + 1 if from_page > 0 and to_page > 0 else 0,
+            "Sequence": ident.get("Sequence"),
+            "SessionId": ident.get("SessionId")
+        }
+
+        logger.info(f"📋 Demarcation result for Sequence {ident.get('Sequence')}: Pages {from_page}-{to_page}")
+        sub_document_rows.append(sub_doc_row)
+
+    return sub_document_rows